@@ -1,6 +1,8 @@
+import itertools
 from typing import Any
 
-from sqlalchemy import MetaData, inspect, create_engine
+import numpy as np
+from sqlalchemy import MetaData, Table, inspect, create_engine, select
 from sqlalchemy.orm import Session, sessionmaker, DeclarativeMeta, declarative_base
 
 
@@ -9,16 +11,59 @@ class PostgresConnection:
                  host: str = "localhost",
                  port: int | str = 5432,
                  user: str | None = None,
-                 password: str | None = None):
+                 password: str | None = None,
+                 pool_size: int = 5,
+                 max_overflow: int = 10,
+                 pool_recycle: int = 1800):
 
         database_url = f'postgresql://{user}:{password}@{host}:{port}'
 
-        self.__engine = create_engine(database_url)
+        self.__engine = create_engine(database_url,
+                                      pool_size=pool_size,
+                                      max_overflow=max_overflow,
+                                      pool_recycle=pool_recycle,
+                                      pool_pre_ping=True)
 
         self.session = Session(bind=self.__engine)
 
+        # Reflected schema, filled lazily table by table and reset by create_tables/delete_tables
+        self.__metadata = MetaData()
+
+    @property
+    def engine(self):
+        return self.__engine
+
+    def invalidate_metadata_cache(self) -> None:
+        """Forget reflected tables (call after changing the schema outside this class)."""
+        self.__metadata = MetaData()
+
     def create_tables(self, Base):
         Base.metadata.create_all(bind=self.__engine)
+        self.invalidate_metadata_cache()
+
+    def __get_table(self, table_class=None, table_name: str = None) -> Table:
+        """
+        Get table object from ORM class or by name. Tables are reflected only once per connection.
+        Args:
+            table_class: ORM class representing the table.
+            table_name (str): Name of the table.
+        Returns:
+            Table: Table object.
+        """
+
+        if table_class:
+            return table_class.__table__
+
+        if not table_name:
+            raise ValueError("Either table_class or table_name must be provided.")
+
+        table_obj = self.__metadata.tables.get(table_name)
+        if table_obj is None:
+            if not inspect(self.__engine).has_table(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist.")
+            table_obj = Table(table_name, self.__metadata, autoload_with=self.__engine)
+
+        return table_obj
 
     def get_data_from_table(self, table_class=None, table_name: str = None, columns: list[str] | None = None) -> list:
         """
@@ -31,18 +76,7 @@ class PostgresConnection:
             list[dict]: List of rows with specified columns.
         """
 
-        if table_class:
-            table_obj = table_class.__table__
-
-        elif table_name:
-            metadata = MetaData()
-            metadata.reflect(bind=self.session.bind)
-            table_obj = metadata.tables.get(table_name)
-            if table_obj is None:
-                raise ValueError(f"Table '{table_name}' does not exist.")
-
-        else:
-            raise ValueError("Either table_class or table_name must be provided.")
+        table_obj = self.__get_table(table_class, table_name)
 
         inspector = inspect(table_obj)
         if columns is None:
@@ -59,6 +93,49 @@ class PostgresConnection:
 
         return results
 
+    def iter_data_from_table(self,
+                             table_class=None,
+                             table_name: str = None,
+                             columns: list[str] | None = None,
+                             fetch_size: int = 10000,
+                             as_numpy: bool = False,
+                             dtype=None):
+        """
+        Stream data from a table chunk by chunk through a server-side cursor (stream_results + yield_per),
+        so the whole table is never materialized in memory.
+        Args:
+            table_class: ORM class representing the table.
+            table_name (str): Name of the table to read.
+            columns (list[str]): List of column names to fetch. If not provided -> all table columns
+            fetch_size (int): Number of rows fetched from the server at once.
+            as_numpy (bool): if True then every chunk is yielded as a NumPy structured array.
+            dtype: NumPy dtype of the structured array. If None then it is inferred from the data.
+        Yields:
+            list[Row] | np.recarray: Chunk of at most fetch_size rows.
+        """
+
+        table_obj = self.__get_table(table_class, table_name)
+
+        table_columns = [column.name for column in table_obj.columns]
+        if columns is None:
+            columns = table_columns
+
+        invalid_columns = [col for col in columns if col not in table_columns]
+        if invalid_columns:
+            raise ValueError(f"Invalid columns {invalid_columns} for table {table_obj.name}")
+
+        # A separate connection, so the session can be used while the generator is alive
+        with self.__engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=fetch_size) \
+                .execute(select(*[table_obj.c[column] for column in columns]))
+
+            for chunk in result.partitions(fetch_size):
+                if as_numpy:
+                    yield np.rec.fromrecords([tuple(row) for row in chunk], dtype=dtype) if dtype is not None \
+                        else np.rec.fromrecords([tuple(row) for row in chunk], names=columns)
+                else:
+                    yield chunk
+
     def insert_data_to_table(self,
                              data: list[list[str]],
                              columns: list[str] | None = None,
@@ -73,18 +150,7 @@ class PostgresConnection:
             table_name (str): Name of the table to insert data into.
         """
 
-        if table_class:
-            table_obj = table_class.__table__
-
-        elif table_name:
-            metadata = MetaData()
-            metadata.reflect(bind=self.session.bind)
-            table_obj = metadata.tables.get(table_name)
-            if table_obj is None:
-                raise ValueError(f"Table '{table_name}' does not exist.")
-
-        else:
-            raise ValueError("Either table_class or table_name must be provided.")
+        table_obj = self.__get_table(table_class, table_name)
 
         inspector = inspect(table_obj)
 
@@ -107,6 +173,57 @@ class PostgresConnection:
 
         return inserted_primary_keys
 
+    def bulk_insert_data_to_table(self,
+                                  data,
+                                  columns: list[str] | None = None,
+                                  table_class=None,
+                                  table_name: str = None,
+                                  chunk_size: int = 1000,
+                                  returning: str | None = "id") -> list | int:
+        """
+        Insert many rows into a table in chunks within a single transaction.
+        With `returning` each chunk is sent as one multi-row INSERT ... RETURNING statement and generated values
+        are returned. Without it each chunk is sent as a single executemany call.
+        Args:
+            data (Iterable[Sequence]): Rows with data. Can be a generator, it is consumed chunk by chunk.
+            columns: (list(str)) | None: A list of column names. If None then all table columns.
+            table_class: ORM class representing the table.
+            table_name (str): Name of the table to insert data into.
+            chunk_size (int): Number of rows sent to the server in one statement.
+            returning (str | None): Column to return for inserted rows. If None then executemany is used.
+        Returns:
+            list | int: Returned column values of inserted rows, or the number of inserted rows if returning is None.
+        """
+
+        table_obj = self.__get_table(table_class, table_name)
+
+        table_columns = [column.name for column in table_obj.columns]
+        if columns is None:
+            columns = table_columns
+
+        invalid_columns = [col for col in columns + ([returning] if returning else []) if col not in table_columns]
+        if invalid_columns:
+            raise ValueError(f"Invalid columns {invalid_columns} for table {table_obj.name}")
+
+        rows = iter(data)
+        result = [] if returning else 0
+        try:
+            for chunk in iter(lambda: list(itertools.islice(rows, chunk_size)), []):
+                insert_data = [dict(zip(columns, row)) for row in chunk]
+                if returning:
+                    statement = table_obj.insert().values(insert_data).returning(table_obj.c[returning])
+                    result.extend(self.session.execute(statement).scalars())
+                else:
+                    self.session.execute(table_obj.insert(), insert_data)
+                    result += len(chunk)
+        except Exception as error:
+            self.session.rollback()
+            raise error
+
+        self.session.commit()
+
+        return result
+
     def get_tables_list(self) -> list[str]:
         """
         List all tables in the database.
@@ -159,12 +276,9 @@ class PostgresConnection:
         if not table_names:
             ValueError(f"Table names or table classes must be provided")
 
-        for table_name in table_names:
-            metadata = MetaData()
-            metadata.reflect(bind=self.session.bind)
-            table_obj = metadata.tables.get(table_name)
-
-            if table_obj is None:
-                raise ValueError(f"Table '{table_name}' does not exist.")
-
-            table_obj.drop(self.session.bind)
+        try:
+            for table_name in table_names:
+                table_obj = self.__get_table(table_name=table_name)
+                table_obj.drop(self.session.bind)
+        finally:
+            self.invalidate_metadata_cache()
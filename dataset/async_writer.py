@@ -0,0 +1,351 @@
+import asyncio
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from psycopg2_utils import load_sql_templates, rows_to_csv
+
+# One frame of a video with its labels: written to the frame and label tables in one transaction
+FrameRecord = namedtuple('FrameRecord', ['video_id', 'frame_num', 'labels'])
+
+LABEL_COLUMNS = ['frame_id', 'x', 'y', 'width', 'height', 'misc']
+
+
+def detections_to_labels(detections, class_names=None, extra=None) -> list[tuple]:
+    """
+    Convert detector output into label rows for submit_frame.
+    Args:
+        detections: Structured array with x1, y1, x2, y2, conf and cls fields.
+        class_names (dict[int, str] | list[str] | None): Class names of the model, stored in misc.
+        extra (list[dict] | None): Additional misc fields for every detection (e.g. track ids).
+    Returns:
+        list[tuple]: Rows (x, y, width, height, misc).
+    """
+    labels = []
+    for i, detection in enumerate(detections):
+        x1, y1, x2, y2 = (int(detection[key]) for key in ('x1', 'y1', 'x2', 'y2'))
+        cls = int(detection['cls'])
+        misc = {'conf': round(float(detection['conf']), 4), 'cls': cls}
+        if class_names is not None:
+            if isinstance(class_names, dict):
+                misc['class_name'] = class_names.get(cls, "Unknown")
+            else:
+                misc['class_name'] = class_names[cls] if 0 <= cls < len(class_names) else "Unknown"
+        if extra is not None:
+            misc.update(extra[i])
+        labels.append((x1, y1, x2 - x1, y2 - y1, misc))
+    return labels
+
+
+class AsyncDetectionWriter:
+    """
+    Background writer of detection records.
+
+    Records are put to a bounded asyncio queue from any thread and a consumer running on its own event loop
+    coalesces them into batches: one COPY statement per table and column set. Frames submitted with
+    `submit_frame` are inserted with INSERT ... RETURNING to get their ids, and their labels are copied
+    in the same transaction. Batches are written over a small psycopg2 connection pool by worker threads,
+    so capture loops never wait for the database.
+    When the queue is full `submit` either waits (block=True, backpressure) or drops the record and counts it.
+    A batch that still fails after `max_retries` retries is counted in `failed` and its records are kept
+    in `failed_records`, from where `retry_failed` can queue them again.
+    """
+
+    def __init__(self,
+                 host: str = "localhost",
+                 port: int | str = 5432,
+                 user: str | None = None,
+                 password: str | None = None,
+                 pool_size: int = 2,
+                 batch_size: int = 1000,
+                 flush_interval: float = 1.0,
+                 max_pending: int = 10000,
+                 block: bool = False,
+                 max_retries: int = 3,
+                 retry_delay: float = 0.5,
+                 pool=None):
+        """
+        Args:
+            host, port, user, password: Connection parameters, as for psycopg2_utils.PostgresConnection.
+            pool_size (int): Number of connections, i.e. batches written at the same time.
+            batch_size (int): Maximum number of records in one batch.
+            flush_interval (float): Maximum number of seconds a record waits for its batch to fill up.
+            max_pending (int): Size of the queue of records that were not written yet.
+            block (bool): if True then submit waits for free space in the queue, otherwise records are dropped.
+            max_retries (int): Number of retries of a failed batch.
+            retry_delay (float): Seconds before the first retry, doubled for every next one.
+            pool: Object with getconn/putconn/closeall methods to use instead of a new ThreadedConnectionPool.
+        """
+
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block = block
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        if pool is None:
+            mapping = (("host", host), ("port", port), ("user", user), ("password", password))
+            pool = ThreadedConnectionPool(1, pool_size, **{key: value for key, value in mapping if value is not None})
+        self.__pool = pool
+
+        self.__templates = load_sql_templates()
+        self.__executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='db-writer')
+
+        # Counters are changed only on the event loop; after flush() submitted == written + dropped + failed
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.failed_records = []
+        self.last_error = None
+        self.__closed = False
+
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name='db-writer-loop', daemon=True)
+        self.__thread.start()
+        asyncio.run_coroutine_threadsafe(self.__start(), self.__loop).result()
+
+    async def __start(self):
+        self.__queue = asyncio.Queue(maxsize=self.max_pending)
+        self.__flush_requested = asyncio.Event()
+        self.__write_slots = asyncio.Semaphore(self.pool_size)
+        self.__writes = set()
+        self.__consumer = asyncio.get_running_loop().create_task(self.__consume())
+
+    def submit(self, table_name: str, row, columns: list[str]) -> None:
+        """
+        Queue one row for writing. Can be called from any thread.
+        Args:
+            table_name (str): Name of the table.
+            row (Sequence): Row values in order of columns.
+            columns (list[str]): Column names.
+        """
+
+        self.__enqueue((table_name, tuple(columns), row))
+
+    def submit_many(self, table_name: str, rows, columns: list[str]) -> None:
+        for row in rows:
+            self.submit(table_name, row, columns)
+
+    def submit_frame(self, video_id: int, frame_num: int, labels) -> None:
+        """
+        Queue one frame with its labels. Can be called from any thread.
+        Args:
+            video_id (int): Id of the video (see open_video).
+            frame_num (int): Number of the frame in the video.
+            labels (list[tuple]): Rows (x, y, width, height, misc), e.g. from detections_to_labels.
+        """
+
+        # Frame records have no column set: they are written by __write_frames
+        self.__enqueue(('frame', None, FrameRecord(video_id, frame_num, list(labels))))
+
+    def submit_detections(self, video_id: int, frame_num: int, detections, class_names=None, extra=None) -> None:
+        """Queue one frame with detector output, converted by detections_to_labels."""
+        self.submit_frame(video_id, frame_num, detections_to_labels(detections, class_names, extra))
+
+    def open_video(self, path: str, fps: float | None = None, started_at=None) -> int:
+        """
+        Create a row in the video table synchronously.
+        Returns:
+            int: Id of the video for submit_frame.
+        """
+
+        def insert_video(cursor):
+            query, _ = self.__templates['bulk_insert_data_to_table'].compose(
+                {'table': 'video', 'columns': ['path', 'fps', 'started_at'], 'returning': 'id'}, cursor)
+            return execute_values(cursor, query, [(path, fps, started_at)], fetch=True)[0][0]
+
+        return self.__transaction(insert_video)
+
+    def retry_failed(self) -> int:
+        """
+        Queue records of failed batches again.
+        Returns:
+            int: Number of queued records.
+        """
+
+        records = asyncio.run_coroutine_threadsafe(self.__take_failed(), self.__loop).result()
+        for record in records:
+            self.__enqueue(record)
+        return len(records)
+
+    async def __take_failed(self):
+        records, self.failed_records = self.failed_records, []
+        self.failed -= len(records)
+        self.submitted -= len(records)
+        return records
+
+    def __enqueue(self, record):
+        if self.__closed:
+            raise RuntimeError("Writer is closed")
+
+        if self.block:
+            asyncio.run_coroutine_threadsafe(self.__put(record), self.__loop).result()
+        else:
+            self.__loop.call_soon_threadsafe(self.__put_nowait, record)
+
+    async def __put(self, record):
+        self.submitted += 1
+        await self.__queue.put(record)
+
+    def __put_nowait(self, record):
+        self.submitted += 1
+        try:
+            self.__queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def pending(self) -> int:
+        """Number of records that were queued but not written yet."""
+        return self.__queue.qsize()
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Write all queued records now and wait until they are committed."""
+        # Callbacks of call_soon_threadsafe run in order, so records submitted before are already in the queue
+        asyncio.run_coroutine_threadsafe(self.__flush(), self.__loop).result(timeout)
+
+    async def __flush(self):
+        self.__flush_requested.set()
+        try:
+            await self.__queue.join()
+        finally:
+            self.__flush_requested.clear()
+
+    def close(self, timeout: float | None = None) -> None:
+        """Write queued records, stop the event loop and close connections."""
+
+        if self.__closed:
+            return
+        self.__closed = True
+
+        try:
+            self.flush(timeout)
+        finally:
+            asyncio.run_coroutine_threadsafe(self.__stop(), self.__loop).result()
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+            self.__loop.close()
+            self.__executor.shutdown()
+            self.__pool.closeall()
+
+    async def __stop(self):
+        self.__consumer.cancel()
+        try:
+            await self.__consumer
+        except asyncio.CancelledError:
+            pass
+        if self.__writes:
+            await asyncio.wait(self.__writes)
+
+    async def __consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.__queue.get()]
+
+            # Fill the batch until it is full, the interval passes or flush is requested
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                while len(batch) < self.batch_size and not self.__queue.empty():
+                    batch.append(self.__queue.get_nowait())
+
+                timeout = deadline - loop.time()
+                if len(batch) >= self.batch_size or timeout <= 0 or self.__flush_requested.is_set():
+                    break
+
+                get = loop.create_task(self.__queue.get())
+                flush = loop.create_task(self.__flush_requested.wait())
+                await asyncio.wait({get, flush}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                flush.cancel()
+                if get.done():
+                    batch.append(get.result())
+                else:
+                    get.cancel()
+                    # The record could be taken right before cancellation
+                    try:
+                        await get
+                    except asyncio.CancelledError:
+                        pass
+                    else:
+                        batch.append(get.result())
+
+            groups = {}
+            for table_name, columns, row in batch:
+                groups.setdefault((table_name, columns), []).append(row)
+
+            for (table_name, columns), rows in groups.items():
+                await self.__write_slots.acquire()
+                write = loop.create_task(self.__write_batch(table_name, columns, rows))
+                self.__writes.add(write)
+                write.add_done_callback(self.__writes.discard)
+
+    async def __write_batch(self, table_name, columns, rows):
+        loop = asyncio.get_running_loop()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    await loop.run_in_executor(self.__executor, self.__write, table_name, columns, rows)
+                    self.written += len(rows)
+                    return
+                except Exception as error:
+                    self.last_error = error
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+            # The transaction was rolled back, so the whole batch can be queued again with retry_failed
+            self.failed += len(rows)
+            self.failed_records.extend((table_name, columns, row) for row in rows)
+            print(f"Failed to write {len(rows)} records to {table_name} after {self.max_retries + 1} attempts: "
+                  f"{self.last_error}")
+        finally:
+            self.__write_slots.release()
+            for _ in rows:
+                self.__queue.task_done()
+
+    def __write(self, table_name, columns, rows):
+        if columns is None:
+            self.__transaction(self.__write_frames, rows)
+        else:
+            self.__transaction(self.__copy_rows, table_name, columns, rows)
+
+    def __copy_rows(self, cursor, table_name, columns, rows):
+        query, _ = self.__templates['copy_data_to_table'].compose({'table': table_name, 'columns': list(columns)},
+                                                                  cursor)
+        cursor.copy_expert(query, rows_to_csv(rows))
+
+    def __write_frames(self, cursor, records):
+        # Same as DetectionWriter.flush: frame ids come back from INSERT ... RETURNING, labels are written after
+        query, _ = self.__templates['bulk_insert_data_to_table'].compose(
+            {'table': 'frame', 'columns': ['video_id', 'frame_num'], 'returning': ['video_id', 'frame_num', 'id']},
+            cursor)
+        frame_ids = execute_values(cursor, query, [(record.video_id, record.frame_num) for record in records],
+                                   page_size=len(records), fetch=True)
+        frame_ids = {(video_id, frame_num): frame_id for video_id, frame_num, frame_id in frame_ids}
+
+        labels = [(frame_ids[(record.video_id, record.frame_num)], *label)
+                  for record in records for label in record.labels]
+        if labels:
+            self.__copy_rows(cursor, 'label', LABEL_COLUMNS, labels)
+
+    def __transaction(self, write, *args):
+        conn = self.__pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                result = write(cursor, *args)
+            conn.commit()
+            return result
+        except Exception as error:
+            conn.rollback()
+            raise error
+        finally:
+            self.__pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
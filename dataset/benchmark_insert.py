@@ -0,0 +1,65 @@
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+from psycopg2_utils import PostgresConnection
+
+BENCHMARK_TABLE = "benchmark_label"
+
+CREATE_BENCHMARK_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id SERIAL PRIMARY KEY,
+    image_id INT,
+    x INT,
+    y INT,
+    width INT,
+    height INT,
+    misc JSON
+)"""
+
+
+def make_rows(count: int) -> list[list]:
+    return [[i // 10, i % 640, i % 480, 50, 80, '{"conf": 0.5}'] for i in range(count)]
+
+
+def measure(name: str, func, rows: int) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {rows:>8} rows {elapsed:>8.2f} s {rows / elapsed:>12.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row insertion paths of psycopg2_utils.PostgresConnection")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows for the bulk paths")
+    parser.add_argument("--slow-rows", type=int, default=2000, help="Rows for the row-by-row path")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per statement for the bulk paths")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = PostgresConnection(host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"), user=os.getenv("DB_USER"),
+                              password=os.getenv("DB_PASSWD"))
+    conn.execute_sql_template(CREATE_BENCHMARK_TABLE, to_replace={"table": BENCHMARK_TABLE})
+
+    columns = ["image_id", "x", "y", "width", "height", "misc"]
+    try:
+        slow_rows = [[str(value) for value in row] for row in make_rows(args.slow_rows)]
+        measure("insert_data_to_table", lambda: conn.insert_data_to_table(BENCHMARK_TABLE, slow_rows, columns),
+                args.slow_rows)
+
+        rows = make_rows(args.rows)
+        measure("bulk insert (RETURNING id)",
+                lambda: conn.bulk_insert_data_to_table(BENCHMARK_TABLE, rows, columns, chunk_size=args.chunk_size),
+                args.rows)
+        measure("bulk COPY",
+                lambda: conn.bulk_insert_data_to_table(BENCHMARK_TABLE, rows, columns, chunk_size=args.chunk_size,
+                                                       returning=None),
+                args.rows)
+    finally:
+        conn.delete_tables([BENCHMARK_TABLE])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import argparse
+import os
+
+import numpy as np
+
+from reid_index import l2_normalize
+
+# Number of unmatched sightings compared with each other at once when new clusters are created
+LEADER_BLOCK_SIZE = 1024
+
+
+def cluster_sums(x, assign, n_clusters):
+    """Sums and sizes of clusters over rows sorted by cluster (np.add.at is much slower)."""
+    counts = np.bincount(assign, minlength=n_clusters)
+    sums = np.zeros((n_clusters, x.shape[1]), dtype=np.float32)
+    present = np.flatnonzero(counts)
+    if len(present):
+        starts = (np.cumsum(counts) - counts)[present]
+        sums[present] = np.add.reduceat(x[np.argsort(assign, kind='stable')], starts, axis=0)
+    return sums, counts
+
+
+class SightingClusterer:
+    """
+    Incremental clustering of sighting (crop) embeddings into individual dogs.
+
+    New sightings are assigned to the nearest cluster centroid when cosine similarity is at least `threshold`,
+    otherwise they start a new cluster. recluster() periodically merges clusters whose centroids became close and
+    reassigns stored embeddings chunk by chunk, so the whole corpus is never compared pairwise. Cluster ids are
+    persistent: a merged cluster keeps the oldest id, and the state is saved to an .npz file.
+    """
+
+    def __init__(self, threshold=0.75, merge_threshold=None, min_sightings=1, chunk_size=8192):
+        """
+        Args:
+            threshold (float): Minimal cosine similarity between a sighting and a cluster centroid.
+            merge_threshold (float | None): Minimal similarity of centroids merged by recluster(), threshold by default.
+            min_sightings (int): Clusters with fewer sightings are not counted as dogs.
+            chunk_size (int): Number of embeddings compared with centroids at once.
+        """
+        self.threshold = threshold
+        self.merge_threshold = threshold if merge_threshold is None else merge_threshold
+        self.min_sightings = min_sightings
+        self.chunk_size = chunk_size
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.sums = None
+        self.centroids = None
+        self.counts = np.empty(0, dtype=np.int64)
+        self.next_id = 0
+        self.assignments = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def unique_count(self):
+        """Number of clusters (dogs) with at least min_sightings sightings."""
+        return int((self.counts >= self.min_sightings).sum())
+
+    def assign(self, embeddings, keys=None):
+        """
+        Assign new sightings to clusters, creating clusters when needed.
+        Args:
+            embeddings: Matrix n x dim.
+            keys (list | None): Sighting keys (e.g. crop paths) to remember assignments for.
+        Returns:
+            np.ndarray: Cluster id of every sighting.
+        """
+        if self.sums is None:
+            self.sums = np.empty((0, embeddings.shape[1]), dtype=np.float32)
+            self.centroids = self.sums.copy()
+
+        result = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), self.chunk_size):
+            chunk = l2_normalize(embeddings[start:start + self.chunk_size])
+            result[start:start + len(chunk)] = self.__assign_chunk(chunk)
+
+        if keys is not None:
+            self.assignments.update(zip(keys, result.tolist()))
+        return result
+
+    def __assign_chunk(self, chunk):
+        rows = np.full(len(chunk), -1, dtype=np.int64)
+        if len(self.centroids):
+            similarity = chunk @ self.centroids.T
+            best = similarity.argmax(axis=1)
+            matched = similarity[np.arange(len(chunk)), best] >= self.threshold
+            rows[matched] = best[matched]
+
+        # Sightings without a close cluster: compared only with clusters created in this chunk, whose sums and
+        # normalized centroids are kept in preallocated buffers and updated in place
+        unmatched = np.flatnonzero(rows == -1)
+        first_new = len(self.ids)
+        new_sums = np.zeros((len(unmatched), chunk.shape[1]), dtype=np.float32)
+        new_centroids = np.zeros_like(new_sums)
+        n_new = 0
+        for start in range(0, len(unmatched), LEADER_BLOCK_SIZE):
+            block = unmatched[start:start + LEADER_BLOCK_SIZE]
+            vectors = chunk[block]
+            block_rows = np.full(len(block), -1, dtype=np.int64)
+            if n_new:
+                similarity = vectors @ new_centroids[:n_new].T
+                best = similarity.argmax(axis=1)
+                matched = similarity[np.arange(len(block)), best] >= self.threshold
+                block_rows[matched] = best[matched]
+
+            rest = np.flatnonzero(block_rows == -1)
+            if len(rest):
+                # Leaders start new clusters, every other sighting joins its most similar leader
+                similarity = vectors[rest] @ vectors[rest].T
+                leaders = self.__leaders(similarity >= self.threshold)
+                block_rows[rest] = n_new + similarity[:, leaders].argmax(axis=1)
+                n_new += len(leaders)
+
+            sums, _ = cluster_sums(vectors, block_rows, n_new)
+            new_sums[:n_new] += sums
+            touched = np.unique(block_rows)
+            new_centroids[touched] = l2_normalize(new_sums[touched])
+            rows[block] = first_new + block_rows
+
+        if n_new:
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + n_new)])
+            self.next_id += n_new
+            self.sums = np.concatenate([self.sums, np.zeros((n_new, self.sums.shape[1]), np.float32)])
+            self.counts = np.concatenate([self.counts, np.zeros(n_new, np.int64)])
+
+        # Running means of centroids
+        sums, counts = cluster_sums(chunk, rows, len(self.ids))
+        self.sums += sums
+        self.counts += counts
+        updated = np.unique(rows)
+        if len(self.centroids) < len(self.sums):
+            self.centroids = np.concatenate([self.centroids, np.zeros((len(self.sums) - len(self.centroids),
+                                                                       self.sums.shape[1]), np.float32)])
+        self.centroids[updated] = l2_normalize(self.sums[updated])
+
+        return self.ids[rows]
+
+    @staticmethod
+    def __leaders(close):
+        # Greedy leader pass over the boolean similarity matrix of a block: a sighting becomes a leader
+        # when no earlier leader is close to it
+        covered = np.zeros(len(close), dtype=bool)
+        leaders = []
+        for i in range(len(close)):
+            if not covered[i]:
+                leaders.append(i)
+                covered |= close[i]
+        return np.array(leaders, dtype=np.int64)
+
+    def recluster(self, embeddings, keys=None):
+        """
+        Merge close clusters and reassign all stored sightings to the nearest centroid.
+        Args:
+            embeddings: All sighting embeddings, n x dim (can be a memory-mapped EmbeddingStore matrix).
+            keys (list | None): Sighting keys in the same order.
+        Returns:
+            np.ndarray: Cluster id of every sighting.
+        """
+        if len(self.ids) == 0:
+            return self.assign(embeddings, keys)
+
+        self.__merge()
+
+        sums = np.zeros_like(self.sums)
+        counts = np.zeros_like(self.counts)
+        rows = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), self.chunk_size):
+            chunk = l2_normalize(embeddings[start:start + self.chunk_size])
+            best = (chunk @ self.centroids.T).argmax(axis=1)
+            rows[start:start + len(chunk)] = best
+            chunk_sums, chunk_counts = cluster_sums(chunk, best, len(counts))
+            sums += chunk_sums
+            counts += chunk_counts
+
+        # Clusters left without sightings disappear
+        keep = counts > 0
+        remap = np.cumsum(keep) - 1
+        self.ids, self.sums, self.counts = self.ids[keep], sums[keep], counts[keep]
+        self.centroids = l2_normalize(self.sums)
+
+        result = self.ids[remap[rows]]
+        if keys is not None:
+            self.assignments = dict(zip(keys, result.tolist()))
+        return result
+
+    def __merge(self):
+        # Union-find over centroid pairs above merge_threshold, compared in blocks
+        parent = np.arange(len(self.ids))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for start in range(0, len(self.centroids), self.chunk_size):
+            similarity = self.centroids[start:start + self.chunk_size] @ self.centroids.T
+            for a, b in zip(*np.nonzero(similarity >= self.merge_threshold)):
+                a, b = find(start + a), find(b)
+                if a != b:
+                    # The root is the older cluster, so it keeps its id
+                    parent[max(a, b)] = min(a, b)
+
+        roots = np.array([find(x) for x in range(len(parent))])
+        if (roots == np.arange(len(roots))).all():
+            return
+
+        merged = np.unique(roots)
+        remap = np.searchsorted(merged, roots)
+        self.sums, _ = cluster_sums(self.sums, remap, len(merged))
+        self.counts = np.bincount(remap, weights=self.counts, minlength=len(merged)).astype(np.int64)
+        self.centroids = l2_normalize(self.sums)
+
+        # Sightings of merged clusters now belong to the surviving id
+        renamed = dict(zip(self.ids.tolist(), self.ids[roots].tolist()))
+        self.ids = self.ids[merged]
+        self.assignments = {key: renamed[cluster_id] for key, cluster_id in self.assignments.items()}
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        keys = list(self.assignments)
+        np.savez(tmp_path, ids=self.ids, sums=self.sums if self.sums is not None else np.empty((0, 0), np.float32),
+                 counts=self.counts, next_id=self.next_id,
+                 params=np.array([self.threshold, self.merge_threshold, self.min_sightings, self.chunk_size]),
+                 keys=np.array(keys, dtype=str), key_ids=np.array([self.assignments[key] for key in keys], np.int64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        threshold, merge_threshold, min_sightings, chunk_size = data['params'].tolist()
+        clusterer = cls(threshold, merge_threshold, int(min_sightings), int(chunk_size))
+        clusterer.ids = data['ids']
+        clusterer.counts = data['counts']
+        clusterer.next_id = int(data['next_id'])
+        if data['sums'].size:
+            clusterer.sums = data['sums']
+            clusterer.centroids = l2_normalize(clusterer.sums)
+        clusterer.assignments = dict(zip(data['keys'].tolist(), data['key_ids'].tolist()))
+        return clusterer
+
+
+if __name__ == '__main__':
+    from embeddings import EmbeddingStore
+
+    parser = argparse.ArgumentParser(description="Count unique dogs by clustering sighting embeddings")
+    parser.add_argument('store_prefix', help="EmbeddingStore prefix (<prefix>.npy, <prefix>.json)")
+    parser.add_argument('clusters', help="Cluster state .npz, created if missing")
+    parser.add_argument('--threshold', type=float, default=0.75)
+    parser.add_argument('--merge-threshold', type=float, default=None)
+    parser.add_argument('--min-sightings', type=int, default=1)
+    parser.add_argument('--recluster', action='store_true', help="Merge clusters and reassign all sightings")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store_prefix)
+    if os.path.exists(args.clusters):
+        clusterer = SightingClusterer.load(args.clusters)
+    else:
+        clusterer = SightingClusterer(args.threshold, args.merge_threshold, args.min_sightings)
+
+    # Only sightings added to the store since the last run are assigned
+    new_rows = [row for row, path in enumerate(store.paths) if path not in clusterer.assignments]
+    if new_rows:
+        clusterer.assign(store.embeddings[new_rows], [store.paths[row] for row in new_rows])
+    if args.recluster and len(store):
+        clusterer.recluster(store.embeddings, store.paths)
+    clusterer.save(args.clusters)
+
+    print(f"new sightings: {len(new_rows)}, clusters: {len(clusterer)}, dogs: {clusterer.unique_count()}")
@@ -1,8 +1,9 @@
-import csv
-import os
+import numpy as np
 from PIL import Image
 from torch.utils.data import Dataset, DataLoader
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
+
+from indexer import index_directory
 
 class DogDataset(Dataset):
     def __init__(self, image_paths, labels, transform=None):
@@ -24,32 +25,106 @@ class DogDataset(Dataset):
         return image, label
 
 class Decomposition:
-    def __init__(self, embeddings):
-        self.pca = PCA(n_components=100)
-        self.pca.fit(embeddings)
+    def __init__(self, embeddings=None, n_components=100, incremental=False, batch_size=10000):
+        self.n_components = n_components
+        self.pca = None
+        self.mean = None
+        self.components = None
+        self.explained_variance_ratio = None
+
+        if embeddings is not None:
+            self.fit(embeddings, incremental=incremental, batch_size=batch_size)
 
+    def fit(self, embeddings, incremental=False, batch_size=10000):
+        # embeddings: matrix (np.memmap, list of vectors, tensor) or generator / sequence of 2-D chunks;
+        # chunks are never concatenated in incremental mode
+        embeddings, streamed = _as_matrix_or_chunks(embeddings)
+        if incremental or streamed:
+            self.pca = IncrementalPCA(n_components=self.n_components)
+            for chunk in _iter_chunks(embeddings, batch_size, min_rows=self.n_components):
+                self.pca.partial_fit(chunk)
+        else:
+            self.pca = PCA(n_components=self.n_components)
+            self.pca.fit(embeddings)
+
+        self.mean = self.pca.mean_.astype(np.float32)
+        self.components = np.ascontiguousarray(self.pca.components_.T, dtype=np.float32)
+        self.explained_variance_ratio = self.pca.explained_variance_ratio_
+        return self
 
     def do_decomposition(self, features):
-        pca_features = self.pca.transform(features)
-        return pca_features
-
-
-def create_dataset_features(data_dir, output_file):
-    with open(output_file, 'w', encoding='utf-8', newline='') as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames=['name', 'photo_path'])
-        writer.writeheader()
-
-        for animal_name in os.listdir(data_dir):
-            animal_path = os.path.join(data_dir, animal_name)
-            if os.path.isdir(animal_path):
-
-                for img_name in os.listdir(animal_path):
-                    img_path = os.path.join(animal_path, img_name)
-                    if img_path.endswith(('.jpg', '.jpeg', '.png')):
-                        writer.writerow({'name': animal_name, 'photo_path': img_path})
-            else:
-                if animal_path.endswith(('.jpg', '.jpeg', '.png')):
-                    writer.writerow({'name': animal_name.replace('.jpg', ''), 'photo_path': animal_path})
+        # Same as PCA.transform (without whitening) but in float32 and without sklearn checks
+        features = np.asarray(features, dtype=np.float32)
+        return (features - self.mean) @ self.components
+
+    def transform_batches(self, features, batch_size=65536, out=None):
+        # Transform a large (memory-mapped) matrix chunk by chunk, out can be a memmap too
+        if out is None:
+            out = np.empty((len(features), self.components.shape[1]), dtype=np.float32)
+        for start in range(0, len(features), batch_size):
+            out[start:start + batch_size] = self.do_decomposition(features[start:start + batch_size])
+        return out
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, components=self.components,
+                 explained_variance_ratio=self.explained_variance_ratio)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        decomposition = cls(n_components=data['components'].shape[1])
+        decomposition.mean = data['mean']
+        decomposition.components = data['components']
+        decomposition.explained_variance_ratio = data['explained_variance_ratio']
+        return decomposition
+
+
+def _as_matrix_or_chunks(embeddings):
+    # Returns (embeddings, is_stream): only iterators and sequences of 2-D chunks are streamed
+    if not isinstance(embeddings, np.ndarray):
+        if iter(embeddings) is embeddings:
+            return embeddings, True
+        if isinstance(embeddings, (list, tuple)) and len(embeddings) and np.ndim(embeddings[0]) == 2:
+            return embeddings, True
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2:
+        raise ValueError(f"Embeddings must be a matrix, got an array with shape {embeddings.shape}")
+    return embeddings, False
+
+
+def _iter_chunks(embeddings, batch_size, min_rows):
+    # IncrementalPCA needs at least n_components rows per partial_fit, small chunks are joined
+    chunks = (embeddings[start:start + batch_size] for start in range(0, len(embeddings), batch_size)) \
+        if isinstance(embeddings, np.ndarray) else embeddings
+
+    # The last full chunk is held back, so a short tail can be joined to it
+    ready = None
+    pending, rows = [], 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if chunk.ndim != 2:
+            raise ValueError(f"Every chunk must be a matrix, got an array with shape {chunk.shape}")
+        pending.append(chunk)
+        rows += len(chunk)
+        if rows >= max(batch_size, min_rows):
+            if ready is not None:
+                yield ready
+            ready = np.concatenate(pending)
+            pending, rows = [], 0
+
+    if rows >= min_rows:
+        if ready is not None:
+            yield ready
+        yield np.concatenate(pending)
+    elif ready is not None:
+        yield np.concatenate([ready] + pending)
+    else:
+        raise ValueError(f"At least {min_rows} rows are needed to fit {min_rows} components")
+
+
+def create_dataset_features(data_dir, output_file, validate=False, workers=None):
+    # Incremental: only new and changed images are processed, see indexer.index_directory
+    return index_directory(data_dir, output_file, validate=validate, workers=workers)
 
 
 
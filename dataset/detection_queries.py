@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, cast, distinct, func, select
+
+from detection_results_tables import Frame, Label, Video
+from SQLALchemy_utils import PostgresConnection
+
+# Frame rate used for videos stored without fps
+DEFAULT_FPS = 25.0
+
+
+def _class_key():
+    # Class name if the model provided it, otherwise class id
+    return func.coalesce(Label.misc['class_name'].as_string(), Label.misc['cls'].as_string()).label('class_name')
+
+
+def dog_counts_per_video(conn: PostgresConnection, video_ids: list[int] | None = None) -> list[dict]:
+    """
+    Count detections and frames with detections for every video.
+    Args:
+        conn (PostgresConnection): SQLAlchemy connection to the database.
+        video_ids (list[int] | None): Videos to count. If None then all videos.
+    Returns:
+        list[dict]: Rows with video_id, path, labels, frames_with_labels and max_labels_per_frame.
+    """
+
+    per_frame = (select(Frame.video_id, Frame.id.label('frame_id'), func.count(Label.id).label('labels'))
+                 .join(Label, Label.frame_id == Frame.id)
+                 .group_by(Frame.video_id, Frame.id))
+    if video_ids is not None:
+        per_frame = per_frame.where(Frame.video_id.in_(video_ids))
+    per_frame = per_frame.subquery()
+
+    query = (select(Video.id.label('video_id'), Video.path,
+                    func.coalesce(func.sum(per_frame.c.labels), 0).label('labels'),
+                    func.count(per_frame.c.frame_id).label('frames_with_labels'),
+                    func.coalesce(func.max(per_frame.c.labels), 0).label('max_labels_per_frame'))
+             .outerjoin(per_frame, per_frame.c.video_id == Video.id)
+             .group_by(Video.id, Video.path)
+             .order_by(Video.id))
+    if video_ids is not None:
+        query = query.where(Video.id.in_(video_ids))
+
+    return [dict(row) for row in conn.session.execute(query).mappings()]
+
+
+def density_per_window(conn: PostgresConnection,
+                       video_id: int,
+                       window_seconds: float = 60.0,
+                       start_seconds: float | None = None,
+                       end_seconds: float | None = None,
+                       start_time: datetime | None = None,
+                       end_time: datetime | None = None) -> list[dict]:
+    """
+    Detection density of a video in time windows. Time is taken from frame_num and video fps,
+    absolute time is video started_at + frame_num / fps. The time range is turned into a frame_num range
+    so the (video_id, frame_num) index is used.
+    Args:
+        conn (PostgresConnection): SQLAlchemy connection to the database.
+        video_id (int): Video id.
+        window_seconds (float): Window length in seconds.
+        start_seconds (float | None): Beginning of the time range from the start of the video.
+        end_seconds (float | None): End of the time range from the start of the video.
+        start_time (datetime | None): Absolute beginning of the time range, needs video started_at.
+        end_time (datetime | None): Absolute end of the time range, needs video started_at.
+    Returns:
+        list[dict]: Rows with window_start (seconds), window_start_time (datetime or None if the video
+            has no started_at), frames, labels and labels_per_frame.
+    """
+
+    video = conn.session.execute(select(Video.fps, Video.started_at).where(Video.id == video_id)).one_or_none()
+    fps, started_at = video if video is not None else (None, None)
+    fps = fps or DEFAULT_FPS
+    frames_per_window = max(int(round(window_seconds * fps)), 1)
+
+    if start_time is not None or end_time is not None:
+        if started_at is None:
+            raise ValueError(f"Video {video_id} has no started_at, absolute time range can't be used")
+        if start_time is not None:
+            start_seconds = max(start_seconds or 0.0, (start_time - started_at).total_seconds())
+        if end_time is not None:
+            seconds = (end_time - started_at).total_seconds()
+            end_seconds = seconds if end_seconds is None else min(end_seconds, seconds)
+
+    window = cast(func.floor(Frame.frame_num / frames_per_window), Integer).label('window')
+    query = (select(window,
+                    func.count(distinct(Frame.id)).label('frames'),
+                    func.count(Label.id).label('labels'))
+             .outerjoin(Label, Label.frame_id == Frame.id)
+             .where(Frame.video_id == video_id)
+             .group_by(window)
+             .order_by(window))
+    if start_seconds is not None:
+        query = query.where(Frame.frame_num >= int(start_seconds * fps))
+    if end_seconds is not None:
+        query = query.where(Frame.frame_num < int(end_seconds * fps))
+
+    rows = []
+    for row in conn.session.execute(query):
+        window_start = row.window * frames_per_window / fps
+        window_start_time = started_at + timedelta(seconds=window_start) if started_at is not None else None
+        rows.append({'window_start': window_start,
+                     'window_start_time': window_start_time,
+                     'frames': row.frames,
+                     'labels': row.labels,
+                     'labels_per_frame': row.labels / row.frames if row.frames else 0.0})
+    return rows
+
+
+def class_histogram(conn: PostgresConnection, video_id: int | None = None) -> dict[str, int]:
+    """
+    Number of detections of every class.
+    Args:
+        conn (PostgresConnection): SQLAlchemy connection to the database.
+        video_id (int | None): Video id. If None then all videos.
+    Returns:
+        dict[str, int]: Number of detections by class name (or class id if the name wasn't stored).
+    """
+
+    class_key = _class_key()
+    query = select(class_key, func.count(Label.id)).group_by(class_key).order_by(func.count(Label.id).desc())
+    if video_id is not None:
+        query = query.join(Frame, Label.frame_id == Frame.id).where(Frame.video_id == video_id)
+
+    return {name: count for name, count in conn.session.execute(query)}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, JSON, ForeignKey, Float, DateTime, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -7,7 +7,9 @@ Base = declarative_base()
 class Video(Base):
     __tablename__ = 'video'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    path = Column(String, nullable=False)
+    path = Column(String, nullable=False, index=True)
+    fps = Column(Float, nullable=True)
+    started_at = Column(DateTime, nullable=True)
 
     frame = relationship("Frame", back_populates="video")
 
@@ -21,11 +23,16 @@ class Frame(Base):
     video = relationship("Video", back_populates="frame")
     label = relationship("Label", back_populates="frame")
 
+    # Indexes
+    __table_args__ = (
+        Index('frame_video_id_frame_num_idx', 'video_id', 'frame_num', unique=True),
+    )
+
 
 class Label(Base):
     __tablename__ = 'label'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    frame_id = Column(Integer, ForeignKey('frame.id', ondelete='CASCADE'), nullable=False)
+    frame_id = Column(Integer, ForeignKey('frame.id', ondelete='CASCADE'), nullable=False, index=True)
     x = Column(Integer, nullable=False)
     y = Column(Integer, nullable=False)
     width = Column(Integer, nullable=False)
@@ -0,0 +1,150 @@
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, update
+
+from detection_results_tables import Base, Frame, Label, Video
+from SQLALchemy_utils import PostgresConnection
+
+
+class DetectionWriter:
+    """
+    Persist detector output into the Video/Frame/Label tables.
+
+    Frames and their labels are buffered and written in one transaction every `commit_every` frames
+    or `commit_interval` seconds, whichever comes first. Frames are committed in order together with
+    their labels, so after a crash `start_frame` points right after the last committed frame and the run
+    can be resumed without duplicates.
+    """
+
+    def __init__(self,
+                 conn: PostgresConnection,
+                 video_path: str,
+                 class_names: dict[int, str] | list[str] | None = None,
+                 fps: float | None = None,
+                 started_at: datetime | None = None,
+                 commit_every: int = 500,
+                 commit_interval: float = 10.0,
+                 keep_empty_frames: bool = True):
+        """
+        Args:
+            conn (PostgresConnection): SQLAlchemy connection to the database.
+            video_path (str): Path of the processed video, used to find the video of a previous run.
+            class_names (dict[int, str] | list[str] | None): Class names of the model, stored in Label.misc.
+            fps (float | None): Frame rate of the video, used to turn frame numbers into time.
+            started_at (datetime | None): Time of the first frame (for camera recordings).
+            commit_every (int): Maximum number of buffered frames.
+            commit_interval (float): Maximum number of seconds between commits.
+            keep_empty_frames (bool): if True then frames without detections are stored too.
+        """
+
+        self.conn = conn
+        self.session = conn.session
+        self.video_path = os.path.abspath(video_path)
+        self.class_names = class_names
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.keep_empty_frames = keep_empty_frames
+        self.fps = fps
+        self.started_at = started_at
+
+        conn.create_tables(Base)
+        self.video_id, self.start_frame = self.__open_video()
+
+        self.frames_written = 0
+        self.labels_written = 0
+
+        self.__frames = []
+        self.__labels = []
+        self.__last_commit = time.monotonic()
+
+    def __open_video(self) -> tuple[int, int]:
+        """
+        Find the video of a previous run or create a new one.
+        Returns:
+            tuple[int, int]: Video id and number of the first frame that was not committed yet.
+        """
+
+        video_id = self.session.execute(
+            select(Video.id).where(Video.path == self.video_path).order_by(Video.id.desc()).limit(1)).scalar()
+
+        video_info = {key: value for key, value in (('fps', self.fps), ('started_at', self.started_at))
+                      if value is not None}
+
+        if video_id is None:
+            video_id = self.session.execute(
+                insert(Video).values(path=self.video_path, **video_info).returning(Video.id)).scalar()
+            self.session.commit()
+            return video_id, 0
+
+        if video_info:
+            self.session.execute(update(Video).where(Video.id == video_id).values(**video_info))
+
+        last_frame = self.session.execute(select(func.max(Frame.frame_num)).where(Frame.video_id == video_id)).scalar()
+        self.session.commit()
+        return video_id, 0 if last_frame is None else last_frame + 1
+
+    def add(self, frame_num: int, detections) -> None:
+        """
+        Buffer detections of one frame.
+        Args:
+            frame_num (int): Number of the frame in the video.
+            detections: Structured array with x1, y1, x2, y2, conf and cls fields.
+        """
+
+        if len(detections) == 0 and not self.keep_empty_frames:
+            return
+
+        self.__frames.append(frame_num)
+        for detection in detections:
+            x1, y1, x2, y2 = (int(detection[key]) for key in ('x1', 'y1', 'x2', 'y2'))
+            cls = int(detection['cls'])
+            misc = {'conf': round(float(detection['conf']), 4), 'cls': cls}
+            if self.class_names is not None:
+                misc['class_name'] = self.__class_name(cls)
+            self.__labels.append((frame_num, {'x': x1, 'y': y1, 'width': x2 - x1, 'height': y2 - y1, 'misc': misc}))
+
+        if len(self.__frames) >= self.commit_every or time.monotonic() - self.__last_commit >= self.commit_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered frames and labels in one transaction."""
+
+        if self.__frames:
+            try:
+                frame_ids = self.session.execute(
+                    insert(Frame).values([{'video_id': self.video_id, 'frame_num': frame_num}
+                                          for frame_num in self.__frames])
+                    .returning(Frame.frame_num, Frame.id)).all()
+                frame_ids = dict(frame_ids)
+
+                if self.__labels:
+                    self.session.execute(insert(Label), [{'frame_id': frame_ids[frame_num], **label}
+                                                         for frame_num, label in self.__labels])
+                self.session.commit()
+            except Exception as error:
+                self.session.rollback()
+                raise error
+
+            self.frames_written += len(self.__frames)
+            self.labels_written += len(self.__labels)
+            self.__frames = []
+            self.__labels = []
+
+        self.__last_commit = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __class_name(self, cls: int) -> str:
+        if isinstance(self.class_names, dict):
+            return self.class_names.get(cls, "Unknown")
+        return self.class_names[cls] if 0 <= cls < len(self.class_names) else "Unknown"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # On error buffered frames are still written: they were fully processed
+        self.close()
@@ -0,0 +1,122 @@
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from dataset import DogDataset
+from indexer import file_hash
+
+
+class EmbeddingStore:
+    """
+    On-disk cache of image embeddings.
+
+    Embeddings are kept in a memory-mapped matrix <store_prefix>.npy (one row per image) and rows are keyed
+    by image path and content hash in <store_prefix>.json. update() runs the model in batches only for new
+    images and images whose content changed; a different model_tag invalidates the whole store.
+    """
+
+    def __init__(self, store_prefix, model_tag=None, dtype=np.float16):
+        self.store_path = store_prefix + '.npy'
+        self.meta_path = store_prefix + '.json'
+        self.model_tag = model_tag
+        self.dtype = np.dtype(dtype)
+
+        self.paths = []
+        self.hashes = []
+        self.stats = []
+        self.embeddings = None
+        self.__rows = {}
+
+        if os.path.exists(self.meta_path) and os.path.exists(self.store_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as meta_file:
+                meta = json.load(meta_file)
+            embeddings = np.load(self.store_path, mmap_mode='r')
+            # A store interrupted between writing the matrix and the keys is rebuilt
+            if meta['model_tag'] == model_tag and meta['dtype'] == self.dtype.name \
+                    and len(meta['paths']) == len(embeddings):
+                self.paths, self.hashes, self.stats = meta['paths'], meta['hashes'], meta['stats']
+                self.embeddings = embeddings
+                self.__rows = {path: row for row, path in enumerate(self.paths)}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return path in self.__rows
+
+    def get(self, photo_paths):
+        """Embeddings of images as a matrix len(photo_paths) x dim (images must be in the store)."""
+        return self.embeddings[[self.__rows[path] for path in photo_paths]]
+
+    def update(self, photo_paths, model, transform, batch_size=64, workers=0, device='cpu'):
+        """
+        Make the store contain exactly photo_paths, computing embeddings only for new or changed images.
+        Returns:
+            int: Number of computed embeddings.
+        """
+        rows_by_hash = {digest: row for row, digest in enumerate(self.hashes)}
+        stats, hashes = [], []
+        source_rows = []  # row of the old matrix for every image or -1 if the embedding must be computed
+        for path in photo_paths:
+            stat = os.stat(path)
+            stat = [stat.st_size, stat.st_mtime_ns]
+            row = self.__rows.get(path)
+
+            # Hash is recomputed only when size or mtime changed
+            if row is not None and self.stats[row] == stat:
+                digest = self.hashes[row]
+            else:
+                digest = file_hash(path)
+            stats.append(stat)
+            hashes.append(digest)
+            # Renamed and copied images reuse the embedding of the same content
+            source_rows.append(rows_by_hash.get(digest, -1))
+
+        source_rows = np.array(source_rows, dtype=np.int64)
+        to_compute = np.flatnonzero(source_rows == -1)
+        reused = np.flatnonzero(source_rows != -1)
+        computed = self.__compute([photo_paths[i] for i in to_compute], model, transform, batch_size, workers, device)
+
+        if len(computed):
+            dim = computed.shape[1]
+        else:
+            dim = self.embeddings.shape[1] if self.embeddings is not None else 0
+        tmp_path = self.store_path + '.tmp.npy'
+        embeddings = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=self.dtype, shape=(len(photo_paths), dim))
+        if len(to_compute):
+            embeddings[to_compute] = computed
+        if len(reused):
+            embeddings[reused] = self.embeddings[source_rows[reused]]
+        embeddings.flush()
+        del embeddings
+
+        # The old matrix must be unmapped before it is replaced
+        self.embeddings = None
+        os.replace(tmp_path, self.store_path)
+        with open(self.meta_path, 'w', encoding='utf-8') as meta_file:
+            json.dump({'model_tag': self.model_tag, 'dtype': self.dtype.name, 'paths': list(photo_paths),
+                       'hashes': hashes, 'stats': stats}, meta_file, ensure_ascii=False)
+
+        self.paths, self.hashes, self.stats = list(photo_paths), hashes, stats
+        self.embeddings = np.load(self.store_path, mmap_mode='r')
+        self.__rows = {path: row for row, path in enumerate(self.paths)}
+        return len(to_compute)
+
+    def __compute(self, photo_paths, model, transform, batch_size, workers, device):
+        if not photo_paths:
+            return np.empty((0, 0), dtype=self.dtype)
+
+        dataset = DogDataset(photo_paths, list(range(len(photo_paths))), transform=transform)
+        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=workers,
+                                pin_memory=torch.device(device).type == 'cuda')
+
+        model.eval()
+        batches = []
+        with torch.no_grad():
+            for data, _ in dataloader:
+                features = model(data.to(device)).flatten(1)
+                batches.append(features.cpu().numpy().astype(self.dtype))
+        return np.concatenate(batches)
@@ -0,0 +1,157 @@
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+
+# ImageNet normalization used by the ResNet models in models/iss
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def read_dataset_csv(csv_path):
+    """Read a file written by dataset.create_dataset_features, returns (photo_paths, names)."""
+    with open(csv_path, 'r', encoding='utf-8') as csv_file:
+        reader = csv.DictReader(csv_file, delimiter=',')
+        names, photo_paths = [], []
+        for line in reader:
+            names.append(line['name'])
+            photo_paths.append(line['photo_path'])
+    return photo_paths, names
+
+
+def load_image(img_path, resize=256, crop=224):
+    """
+    Same as transforms.Resize(resize) + transforms.CenterCrop(crop) but returns uint8 array 3 x crop x crop.
+    JPEG is decoded at reduced scale when the image is much bigger than needed.
+    """
+    image = Image.open(img_path)
+    image.draft('RGB', (resize, resize))
+    image = image.convert('RGB')
+
+    # Shorter side becomes resize, as in torchvision
+    width, height = image.size
+    if width <= height:
+        size = (resize, int(resize * height / width))
+    else:
+        size = (int(resize * width / height), resize)
+    image = image.resize(size, Image.BILINEAR)
+
+    width, height = image.size
+    left, top = int(round((width - crop) / 2.0)), int(round((height - crop) / 2.0))
+    image = image.crop((left, top, left + crop, top + crop))
+
+    return np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def _fill_store(store_path, start, photo_paths, resize, crop):
+    images = np.load(store_path, mmap_mode='r+')
+    for offset, img_path in enumerate(photo_paths):
+        images[start + offset] = load_image(img_path, resize, crop)
+    images.flush()
+    return len(photo_paths)
+
+
+def build_image_store(csv_path, store_prefix, resize=256, crop=224, workers=None, chunk_size=256):
+    """
+    Decode all images listed in csv_path once and save them as a uint8 array N x 3 x crop x crop.
+    Creates <store_prefix>.npy with images and <store_prefix>.json with paths and labels.
+    """
+    photo_paths, names = read_dataset_csv(csv_path)
+
+    store_path = store_prefix + '.npy'
+    images = np.lib.format.open_memmap(store_path, mode='w+', dtype=np.uint8, shape=(len(photo_paths), 3, crop, crop))
+    del images
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_fill_store, store_path, start, photo_paths[start:start + chunk_size], resize, crop)
+                   for start in range(0, len(photo_paths), chunk_size)]
+        done = 0
+        for future in futures:
+            done += future.result()
+            print(f"{done}/{len(photo_paths)}")
+
+    with open(store_prefix + '.json', 'w', encoding='utf-8') as meta_file:
+        json.dump({'photo_paths': photo_paths, 'labels': names, 'resize': resize, 'crop': crop}, meta_file,
+                  ensure_ascii=False)
+
+    return store_path
+
+
+class ImageStoreDataset(Dataset):
+    """
+    Dataset over a store made by build_image_store. Images are read from the memory-mapped file without copying,
+    so only conversion to float and normalization are done per item.
+    """
+
+    def __init__(self, store_prefix, transform=None, normalize=True):
+        self.store_path = store_prefix + '.npy'
+        with open(store_prefix + '.json', 'r', encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        self.image_paths = meta['photo_paths']
+        self.labels = meta['labels']
+        self.transform = transform
+        self.normalize = normalize
+
+        self.mean = torch.tensor(MEAN).view(3, 1, 1)
+        self.std = torch.tensor(STD).view(3, 1, 1)
+
+        # The file is opened in every DataLoader worker on first access instead of being pickled
+        self.images = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        if self.images is None:
+            # Copy-on-write mapping: writable for torch.from_numpy, nothing is copied until written
+            self.images = np.load(self.store_path, mmap_mode='c')
+
+        image = torch.from_numpy(self.images[idx])
+        if self.normalize:
+            image = (image.float() / 255.0 - self.mean) / self.std
+        if self.transform:
+            image = self.transform(image)
+
+        return image, self.labels[idx]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['images'] = None
+        return state
+
+
+def make_dataloader(dataset, batch_size=64, shuffle=True, workers=None, pin_memory=None, drop_last=False):
+    """
+    DataLoader with worker processes and pinned memory (when CUDA is available) for training from the image store.
+    """
+    if workers is None:
+        workers = min(8, os.cpu_count() or 1)
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    worker_kwargs = {'persistent_workers': True, 'prefetch_factor': 4} if workers > 0 else {}
+    return DataLoader(dataset,
+                      batch_size=batch_size,
+                      shuffle=shuffle,
+                      num_workers=workers,
+                      pin_memory=pin_memory,
+                      drop_last=drop_last,
+                      **worker_kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert dataset csv to a memory-mapped uint8 image store")
+    parser.add_argument('csv_path', help="File written by create_dataset_features")
+    parser.add_argument('store_prefix', help="Output path without extension")
+    parser.add_argument('--resize', type=int, default=256)
+    parser.add_argument('--crop', type=int, default=224)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    build_image_store(args.csv_path, args.store_prefix, resize=args.resize, crop=args.crop, workers=args.workers)
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+# Values of the "valid" field of the index
+NOT_CHECKED, BROKEN, VALID = -1, 0, 1
+
+
+def _scan_dir(dir_path, name):
+    entries = []
+    with os.scandir(dir_path) as iterator:
+        for entry in iterator:
+            if entry.is_file() and entry.name.endswith(IMAGE_SUFFIXES):
+                stat = entry.stat()
+                entries.append((entry.path, name, stat.st_size, stat.st_mtime_ns))
+    return entries
+
+
+def scan_tree(data_dir, workers=None):
+    """
+    Find images as create_dataset_features did: every subdirectory of data_dir is one animal,
+    images right in data_dir are animals with a single photo. Subdirectories are scanned in parallel.
+    Returns:
+        list of (photo_path, name, size, mtime_ns) sorted by path
+    """
+    entries = []
+    subdirs = []
+    with os.scandir(data_dir) as iterator:
+        for entry in iterator:
+            if entry.is_dir():
+                subdirs.append((entry.path, entry.name))
+            elif entry.name.endswith(IMAGE_SUFFIXES):
+                stat = entry.stat()
+                entries.append((entry.path, entry.name.replace('.jpg', ''), stat.st_size, stat.st_mtime_ns))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for dir_entries in executor.map(lambda subdir: _scan_dir(*subdir), subdirs):
+            entries.extend(dir_entries)
+
+    entries.sort()
+    return entries
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_image(path):
+    from PIL import Image
+
+    try:
+        # verify() checks the structure only and leaves the image unusable, load() decodes the pixels,
+        # so truncated and corrupted image data is caught too
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            image.load()
+        return VALID
+    except Exception:
+        return BROKEN
+
+
+def load_index(index_path):
+    """Previous index as {photo_path: (size, mtime_ns, hash, valid)}."""
+    if not os.path.exists(index_path):
+        return {}
+    index = np.load(index_path)
+    return {path: (size, mtime, digest, valid)
+            for path, size, mtime, digest, valid in zip(index['paths'].tolist(), index['sizes'].tolist(),
+                                                         index['mtimes'].tolist(), index['hashes'].tolist(),
+                                                         index['valid'].tolist())}
+
+
+def save_index(index_path, entries, hashes, valid):
+    # Written next to the target and renamed, so an interrupted run leaves the previous index intact
+    tmp_path = index_path + '.tmp.npz'
+    np.savez(tmp_path,
+             paths=np.array([entry[0] for entry in entries], dtype=str),
+             names=np.array([entry[1] for entry in entries], dtype=str),
+             sizes=np.array([entry[2] for entry in entries], dtype=np.int64),
+             mtimes=np.array([entry[3] for entry in entries], dtype=np.int64),
+             hashes=np.array(hashes, dtype='U32'),
+             valid=np.array(valid, dtype=np.int8))
+    os.replace(tmp_path, index_path)
+
+
+def index_directory(data_dir, output_file, index_path=None, validate=False, workers=None):
+    """
+    Incrementally index images of data_dir and write the dataset csv (name, photo_path).
+
+    Size, mtime and content hash of every image are kept in a binary index (<output_file>.index.npz by default).
+    On re-runs only new files and files with changed size or mtime are hashed (and decoded when validate=True).
+    Broken images are kept in the index but not written to the csv.
+    Returns:
+        dict: Number of new, changed, unchanged, removed and broken images.
+    """
+    if index_path is None:
+        index_path = output_file + '.index.npz'
+
+    previous = load_index(index_path)
+    entries = scan_tree(data_dir, workers)
+
+    hashes = [''] * len(entries)
+    valid = [NOT_CHECKED] * len(entries)
+    to_update = []
+    stats = {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+    for i, (path, _, size, mtime) in enumerate(entries):
+        old = previous.get(path)
+        if old is not None and old[0] == size and old[1] == mtime:
+            hashes[i], valid[i] = old[2], old[3]
+            stats['unchanged'] += 1
+        else:
+            to_update.append(i)
+            stats['new' if old is None else 'changed'] += 1
+    stats['removed'] = len(set(previous) - {entry[0] for entry in entries})
+
+    if validate:
+        to_validate = [i for i in range(len(entries)) if valid[i] == NOT_CHECKED]
+    else:
+        to_validate = []
+
+    # hashlib and image decoding release the GIL, so threads are enough here
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, digest in zip(to_update, executor.map(file_hash, [entries[i][0] for i in to_update])):
+            hashes[i] = digest
+        for i, state in zip(to_validate, executor.map(check_image, [entries[i][0] for i in to_validate])):
+            valid[i] = state
+
+    save_index(index_path, entries, hashes, valid)
+
+    with open(output_file, 'w', encoding='utf-8', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=['name', 'photo_path'])
+        writer.writeheader()
+        for (path, name, _, _), state in zip(entries, valid):
+            if state != BROKEN:
+                writer.writerow({'name': name, 'photo_path': path})
+
+    stats['broken'] = valid.count(BROKEN)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Incremental index of a dog photo directory")
+    parser.add_argument('data_dir')
+    parser.add_argument('output_file', help="Dataset csv (name, photo_path)")
+    parser.add_argument('--index', default=None, help="Binary index path, <output_file>.index.npz by default")
+    parser.add_argument('--validate', action='store_true', help="Check that new and changed images decode")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    print(index_directory(args.data_dir, args.output_file, args.index, validate=args.validate, workers=args.workers))
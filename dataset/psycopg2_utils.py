@@ -1,7 +1,184 @@
+import functools
+import io
+import itertools
+import json
+import numbers
 import os
+import re
+import uuid
+from collections import Counter
 
+import numpy as np
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import Json, execute_values
+
+# NULL marker of copy_data_to_table.sql, an unquoted empty field is an empty string there
+COPY_NULL = '\\N'
+
+SQL_QUERIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql_queries')
+
+
+class SqlTemplate:
+    """
+    SQL template parsed once and reused.
+    `{key}` placeholders are replaced with identifiers, `%key%` placeholders with query parameters.
+    Composed statements are cached by identifiers and by lengths of list parameters, so repeated calls
+    only flatten the arguments.
+    """
+
+    IDENTIFIER_PATTERN = re.compile(r"\{(\w+)\}")
+    VALUE_PATTERN = re.compile(r"%(\w+)%")
+    MAX_CACHED_STATEMENTS = 512
+
+    def __init__(self, text: str):
+        self.text = text
+
+        identifier_keys = self.IDENTIFIER_PATTERN.findall(text)
+        value_keys = self.VALUE_PATTERN.findall(text)
+        self.identifier_keys = frozenset(identifier_keys)
+        self.value_keys = tuple(value_keys)  # in template order
+        self.repeated_keys = frozenset(key for key, count in Counter(identifier_keys + value_keys).items() if count > 1)
+
+        self.__statements = {}
+
+    def compose(self, to_replace: dict[str, str | list], context) -> tuple[str, list]:
+        """
+        Build the statement and its arguments.
+        Args:
+            to_replace (dict[str, str | list]): The data to replace SQL template with.
+            context: psycopg2 connection or cursor used to quote identifiers.
+        Returns:
+            tuple[str, list]: SQL statement with %s placeholders and arguments for it.
+        """
+
+        # divide to_replace to identifiers and values for correct replacements
+        identifiers = {}
+        values = {}
+        for key, value in to_replace.items():
+            if key in self.repeated_keys:
+                raise Exception(f"Repeated use of \"{key}\" key word")
+            elif key in self.identifier_keys:
+                identifiers[key] = value
+            elif key in self.value_keys:
+                values[key] = value
+            else:
+                raise Exception(f"\"{key}\" key word wasn't found is sql template")
+
+        cache_key = (tuple((key, tuple(value) if isinstance(value, list) else value)
+                           for key, value in sorted(identifiers.items())),
+                     tuple((key, len(value) if isinstance(value, list) else None)
+                           for key, value in sorted(values.items())))
+        statement = self.__statements.get(cache_key)
+        if statement is None:
+            statement = self.__build_statement(identifiers, values, context)
+            if len(self.__statements) >= self.MAX_CACHED_STATEMENTS:
+                self.__statements.clear()
+            self.__statements[cache_key] = statement
+
+        args = []
+        for key in self.value_keys:
+            if key in values:
+                value = values[key]
+                if isinstance(value, list):
+                    args.extend(value)
+                else:
+                    args.append(value)
+
+        return statement, args
+
+    def __build_statement(self, identifiers: dict[str, str | list], values: dict[str, str | list], context) -> str:
+        # INSERT IDENTIFIERS
+        formating_dict = {}
+        for key, value in identifiers.items():
+            if isinstance(value, str):
+                formating_dict[key] = sql.Identifier(value)
+            if isinstance(value, list):
+                formating_dict[key] = sql.SQL(', ').join(map(sql.Identifier, value))
+
+        statement = sql.SQL(self.text).format(**formating_dict).as_string(context)
+
+        # INSERT VALUES PLACEHOLDERS
+        for key, value in values.items():
+            placeholders = ", ".join(["%s"] * len(value)) if isinstance(value, list) else "%s"
+            statement = statement.replace("%" + key + "%", placeholders)
+
+        return statement
+
+
+@functools.lru_cache(maxsize=256)
+def compile_sql_template(text: str) -> SqlTemplate:
+    """Parse SQL template text once per distinct text."""
+    return SqlTemplate(text)
+
+
+@functools.lru_cache(maxsize=None)
+def load_sql_templates(directory: str = SQL_QUERIES_DIR) -> dict[str, SqlTemplate]:
+    """
+    Load and parse all templates from the sql_queries directory once per process.
+    Returns:
+        dict[str, SqlTemplate]: Templates by file name without extension.
+    """
+    templates = {}
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.sql'):
+            with open(os.path.join(directory, file_name), 'r') as file:
+                templates[file_name[:-len('.sql')]] = compile_sql_template(file.read())
+    return templates
+
+
+def rows_to_csv(rows) -> io.StringIO:
+    """
+    Serialize rows for COPY ... FROM STDIN WITH (FORMAT csv, NULL '\\N').
+    None -> unquoted \\N (NULL), strings are always quoted, so '' and '\\N' stay strings.
+    Values are converted with adapt_value: dicts and lists -> JSON, NumPy scalars and numbers are written as is.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(map(_csv_field, row)))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def adapt_value(value):
+    """
+    Convert a row value to a type both insert paths accept (execute_values adapts it, COPY serializes it).
+    NumPy scalars -> Python scalars, dicts and lists -> Json (NumPy values inside are converted too).
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (dict, list)):
+        return Json(value, dumps=_json_dumps)
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_json_dumps = functools.partial(json.dumps, default=_json_default)
+
+
+def _csv_field(value) -> str:
+    value = adapt_value(value)
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, numbers.Number):
+        return str(value)
+    if isinstance(value, Json):
+        value = value.dumps(value.adapted)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+# Type OIDs (bool, int2, int4, int8, float4, float8) with native NumPy types, other columns become objects
+_NUMPY_TYPES = {16: np.bool_, 21: np.int16, 23: np.int32, 20: np.int64, 700: np.float32, 701: np.float64}
+
+
+def _description_dtype(columns: list[str], description) -> np.dtype:
+    return np.dtype([(name, _NUMPY_TYPES.get(column.type_code, object)) for name, column in zip(columns, description)])
 
 
 class PostgresConnection:
@@ -15,10 +192,54 @@ class PostgresConnection:
 
         self.conn = psycopg2.connect(**conn_kwargs)
         self.cursor = self.conn.cursor()
+        self.__conn_kwargs = conn_kwargs
+
+        self.templates = load_sql_templates()
+
+        # Schema metadata cache, reset by create_tables/delete_tables or invalidate_metadata_cache
+        self.__tables = None
+        self.__columns = {}
+
+    def invalidate_metadata_cache(self):
+        """Forget cached table and column lists (call after changing the schema outside this class)."""
+        self.__tables = None
+        self.__columns = {}
 
     def create_tables(self):
-        with open('sql_queries/create_tables.sql', 'r') as file:
-            self.execute_sql_template(file.read())
+        try:
+            self.execute_sql_template(self.templates['create_tables'])
+        finally:
+            self.invalidate_metadata_cache()
+
+    def create_partitioned_detection_tables(self):
+        """
+        Create video/frame/label detection tables with frame partitioned by video_id and label by frame_id.
+        Rows go to the default partitions until range partitions are added with create_range_partition.
+        """
+        try:
+            self.execute_sql_template(self.templates['create_detection_tables_partitioned'])
+        finally:
+            self.invalidate_metadata_cache()
+
+    def create_range_partition(self, table_name: str, start: int, end: int, partition_name: str | None = None):
+        """
+        Add a range partition to a partitioned table.
+        Rows of the range must not be in the default partition yet.
+        Args:
+            table_name (str): Name of the partitioned table.
+            start (int): Lower bound of the partition key, inclusive.
+            end (int): Upper bound of the partition key, exclusive.
+            partition_name (str | None): Name of the partition. By default "<table>_<start>_<end>".
+        """
+        if partition_name is None:
+            partition_name = f"{table_name}_{start}_{end}"
+
+        try:
+            self.execute_sql_template(self.templates['create_range_partition'],
+                                      to_replace={'table': table_name, 'partition': partition_name,
+                                                  'start': start, 'end': end})
+        finally:
+            self.invalidate_metadata_cache()
 
     def delete_tables(self, table_names: list[str] | None = None):
         """
@@ -30,10 +251,11 @@ class PostgresConnection:
         if table_names is None or len(table_names) == 0:
             raise ValueError(f"Table names must be provided")
 
-        with open('sql_queries/delete_tables.sql', 'r') as file:
-            sql_template = file.read()
+        try:
             for table in table_names:
-                self.execute_sql_template(sql_template, to_replace={"table": table})
+                self.execute_sql_template(self.templates['delete_tables'], to_replace={"table": table})
+        finally:
+            self.invalidate_metadata_cache()
 
     def get_tables_list(self) -> list[str]:
         """
@@ -41,12 +263,11 @@ class PostgresConnection:
         Returns:
             list[str]: List of table names.
         """
-        with open('sql_queries/get_tables_list.sql', 'r') as file:
-            result = self.execute_sql_template(file.read())
+        if self.__tables is None:
+            result = self.execute_sql_template(self.templates['get_tables_list'])
+            self.__tables = [x[0] for x in result] if result is not None else []
 
-            if result is not None:
-                return [x[0] for x in result]
-            return []
+        return list(self.__tables)
 
     def get_columns_list(self, table_name: str) -> list[str]:
         """
@@ -57,15 +278,14 @@ class PostgresConnection:
             list[str]: List of column names.
         """
 
-        if table_name not in self.get_tables_list():
-            raise ValueError(f"Table '{table_name}' does not exist.")
+        if table_name not in self.__columns:
+            if table_name not in self.get_tables_list():
+                raise ValueError(f"Table '{table_name}' does not exist.")
 
-        with open('sql_queries/get_columns_list.sql', 'r') as file:
-            result = self.execute_sql_template(file.read(), to_replace={'table': table_name})
+            result = self.execute_sql_template(self.templates['get_columns_list'], to_replace={'table': table_name})
+            self.__columns[table_name] = [x[0] for x in result] if result is not None else []
 
-            if result is not None:
-                return [x[0] for x in result]
-            return []
+        return list(self.__columns[table_name])
 
     def get_data_from_table(self, table_name: str, columns: list[str] | None = None) -> list:
         """
@@ -80,10 +300,67 @@ class PostgresConnection:
         if columns is None:
             columns = self.get_columns_list(table_name)
 
-        with open('sql_queries/get_data_from_table.sql', 'r') as file:
-            sql_template = file.read()
+        return self.execute_sql_template(self.templates['get_data_from_table'],
+                                         to_replace={'table': table_name, 'columns': columns})
+
+    def iter_data_from_table(self,
+                             table_name: str,
+                             columns: list[str] | None = None,
+                             fetch_size: int = 10000,
+                             as_numpy: bool = False,
+                             dtype=None):
+        """
+        Stream data from a table chunk by chunk through a server-side (named) cursor,
+        so the whole table is never materialized in memory.
+        Args:
+            table_name (str): Name of the table to read.
+            columns (list[str]): List of column names to fetch. If not provided -> all table columns
+            fetch_size (int): Number of rows fetched from the server at once.
+            as_numpy (bool): if True then every chunk is yielded as a NumPy structured array.
+            dtype: NumPy dtype of the structured array. If None then it is derived once from the column types:
+                integer, float and boolean columns keep their NumPy types, other columns are objects.
+                Integer columns with NULL values need an explicit float or object dtype.
+        Yields:
+            list[tuple] | np.recarray: Chunk of at most fetch_size rows.
+        """
+
+        table_columns = self.get_columns_list(table_name)
+        if columns is None:
+            columns = table_columns
 
-            return self.execute_sql_template(sql_template, to_replace={'table': table_name, 'columns': columns})
+        invalid_columns = [col for col in columns if col not in table_columns]
+        if invalid_columns:
+            raise ValueError(f"Invalid columns {invalid_columns} for table {table_name}")
+
+        query, args = self.templates['get_data_from_table'].compose({'table': table_name, 'columns': columns},
+                                                                     self.cursor)
+
+        # Named cursors live inside a transaction, so they get a dedicated read-only connection: commits and
+        # rollbacks on self.conn during iteration neither close the cursor nor end with the caller's transaction.
+        # Rows written through self.conn but not committed yet are not visible here.
+        conn = psycopg2.connect(**self.__conn_kwargs)
+        try:
+            conn.set_session(readonly=True)
+            cursor = conn.cursor(name=f"iter_{table_name}_{uuid.uuid4().hex[:8]}")
+            cursor.itersize = fetch_size
+            cursor.execute(query, args)
+            while True:
+                chunk = cursor.fetchmany(fetch_size)
+                if not chunk:
+                    break
+
+                if as_numpy:
+                    if dtype is None:
+                        dtype = _description_dtype(columns, cursor.description)
+                    try:
+                        chunk = np.rec.fromrecords(chunk, dtype=dtype)
+                    except TypeError as error:
+                        raise ValueError(f"Cannot convert rows of {table_name} to {dtype}, "
+                                         f"pass a float or object dtype for integer columns with NULL values") \
+                            from error
+                yield chunk
+        finally:
+            conn.close()
 
     def insert_data_to_table(self, table_name: str, data: list[list[str]], columns: list[str] | None = None):
         """
@@ -94,31 +371,81 @@ class PostgresConnection:
             table_name (str): Name of the table to insert data into.
         """
 
+        table_columns = self.get_columns_list(table_name)
         if columns is None:
-            columns = self.get_columns_list(table_name)
+            columns = table_columns
 
-        with open('sql_queries/insert_data_to_table.sql', 'r') as file:
-            sql_template = file.read()
+        invalid_columns = [col for col in columns if col not in table_columns]
+        if invalid_columns:
+            raise ValueError(f"Invalid columns {invalid_columns} for table {table_name}")
 
-            invalid_columns = [col for col in columns if col not in self.get_columns_list(table_name)]
-            if invalid_columns:
-                raise ValueError(f"Invalid columns {invalid_columns} for table {table_name}")
+        for value in data:
+            self.execute_sql_template(self.templates['insert_data_to_table'],
+                                      to_replace={'table': table_name, "columns": columns, 'values': value},
+                                      dont_commit=True)
 
-            for value in data:
-                self.execute_sql_template(sql_template,
-                                          to_replace={'table': table_name, "columns": columns, 'values': value},
-                                          dont_commit=True)
+        self.conn.commit()
 
-            self.conn.commit()
+    def bulk_insert_data_to_table(self,
+                                  table_name: str,
+                                  data,
+                                  columns: list[str] | None = None,
+                                  chunk_size: int = 1000,
+                                  returning: str | None = "id") -> list | int:
+        """
+        Insert many rows into a table in chunks within a single transaction.
+        With `returning` rows are sent as multi-row INSERT statements (execute_values) and generated values
+        are returned. Without it rows are streamed through COPY ... FROM STDIN, which is the fastest path.
+        Args:
+            table_name (str): Name of the table to insert data into.
+            data (Iterable[Sequence]): Rows with data. Can be a generator, it is consumed chunk by chunk.
+            columns: (list(str)) | None: A list of column names. If None then all table columns.
+            chunk_size (int): Number of rows sent to the server in one statement.
+            returning (str | None): Column to return for inserted rows. If None then COPY is used.
+        Returns:
+            list | int: Returned column values of inserted rows, or the number of copied rows if returning is None.
+        """
+
+        table_columns = self.get_columns_list(table_name)
+        if columns is None:
+            columns = table_columns
+
+        invalid_columns = [col for col in columns + ([returning] if returning else []) if col not in table_columns]
+        if invalid_columns:
+            raise ValueError(f"Invalid columns {invalid_columns} for table {table_name}")
+
+        identifiers = {'table': table_name, 'columns': columns}
+        if returning:
+            identifiers['returning'] = returning
+        template = self.templates['bulk_insert_data_to_table' if returning else 'copy_data_to_table']
+        query, _ = template.compose(identifiers, self.cursor)
+
+        rows = iter(data)
+        result = [] if returning else 0
+        try:
+            for chunk in iter(lambda: list(itertools.islice(rows, chunk_size)), []):
+                if returning:
+                    chunk = [[adapt_value(value) for value in row] for row in chunk]
+                    result.extend(x[0] for x in execute_values(self.cursor, query, chunk, page_size=chunk_size,
+                                                               fetch=True))
+                else:
+                    self.cursor.copy_expert(query, rows_to_csv(chunk))
+                    result += len(chunk)
+        except Exception as error:
+            self.conn.rollback()
+            raise error
+
+        self.conn.commit()
+        return result
 
     def execute_sql_template(self,
-                             sql_query_base: str,
+                             sql_query_base: str | SqlTemplate,
                              to_replace: dict[str, str | list] | None = None,
                              dont_commit=False) -> list[tuple] | None:
         """
         Execute SQL template with provided params.
         Args:
-            sql_query_base (str): SQL template.
+            sql_query_base (str | SqlTemplate): SQL template text or an already parsed template.
             to_replace (dict[str, str | list] | None): The data to replace SQL template with.
             dont_commit (bool): if True then won't commit changes to database.
         Returns:
@@ -128,36 +455,8 @@ class PostgresConnection:
         if to_replace is None:
             to_replace = {}
 
-        # divide to_replace to identifiers and values for correct replacements
-        identifiers = {}
-        values = {}
-        for key in to_replace:
-            identifier_index = sql_query_base.find("{" + key + "}")
-            value_index = sql_query_base.find("%" + key + "%")
-
-            if identifier_index != -1 and value_index != -1:
-                raise Exception(f"Repeated use of \"{key}\" key word")
-
-            elif identifier_index != -1:
-                if sql_query_base[identifier_index + 1:].find("{" + key + "}") != -1:
-                    raise Exception(f"Repeated use of \"{key}\" key word")
-                identifiers[key] = to_replace[key]
-
-            elif value_index != -1:
-                if sql_query_base[value_index + 1:].find("%" + key + "%") != -1:
-                    raise Exception(f"Repeated use of \"{key}\" key word")
-                values[key] = to_replace[key]
-
-            else:
-                raise Exception(f"\"{key}\" key word wasn't found is sql template")
-
-        # print(f"Вводные данные \n {sql_query_base} \n identifiers {identifiers} \n values {values}")
-
-        # INSERT IDENTIFIERS
-        redacted_sql = self.__replace_identifiers_is_sql(sql_query_base, identifiers).as_string(self.cursor)
-
-        # INSERT VALUES
-        redacted_sql, args = self.__replace_values_in_sql(redacted_sql, values)
+        template = sql_query_base if isinstance(sql_query_base, SqlTemplate) else compile_sql_template(sql_query_base)
+        redacted_sql, args = template.compose(to_replace, self.cursor)
 
         try:
             self.cursor.execute(redacted_sql, args)
@@ -171,59 +470,6 @@ class PostgresConnection:
         if self.cursor.description is not None:
             return self.cursor.fetchall()
 
-    @staticmethod
-    def __replace_identifiers_is_sql(sql_query_base: str, identifiers: dict[str, str | list]):
-        # print("Замена идентификаторов")
-
-        formating_dict = {}
-        for key, value in identifiers.items():
-            if isinstance(value, str):
-                formating_dict[key] = sql.Identifier(value)
-            if isinstance(value, list):
-                formating_dict[key] = sql.SQL(', ').join(map(sql.Identifier, value))
-
-        redacted_sql = sql.SQL(sql_query_base).format(**formating_dict)
-
-        # print(redacted_sql)
-        return redacted_sql
-
-    @staticmethod
-    def __replace_values_in_sql(sql_query_base: str, values: dict[str, str | list]):
-        #  REPLACE CUSTOM ARGUMENTS
-        args = []
-        for key in values.keys():
-            to_replace = "%" + key + "%"
-
-            index = sql_query_base.find(to_replace)
-            if index == -1:
-                raise Exception("key_not_found")
-
-            if isinstance(values[key], str):
-                string_for_replacing = "%s"
-            elif isinstance(values[key], list):
-                string_for_replacing = "%s" + ", %s" * (len(values[key]) - 1)
-            else:
-                Exception("Argument is neither a list nor a string")
-
-            args.append((index, values[key]))
-
-            sql_query_base = sql_query_base[:index] + string_for_replacing + sql_query_base[index + len(to_replace):]
-
-        #  PREPARE ARGUMENT FOR INSERTION
-        args.sort(key=lambda x: x[0])
-
-        new_args = []
-        for arg_tuple in args:
-            arg = arg_tuple[1]
-            if isinstance(arg, str):
-                new_args.append(arg)
-            else:
-                new_args.extend(arg)
-
-        # print(f"Замена значений \n {sql_query_base} \n {new_args}")
-
-        return sql_query_base, new_args
-
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
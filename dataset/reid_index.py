@@ -0,0 +1,123 @@
+import numpy as np
+
+
+def l2_normalize(x, eps=1e-12):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), eps)
+
+
+def top_k(scores, k):
+    """Indices and values of the k largest scores in every row, sorted in descending order."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+def spherical_kmeans(x, n_clusters, n_iter=10, sample_size=None, seed=0):
+    """K-means with cosine similarity on L2-normalized rows, trained on a random sample."""
+    rng = np.random.default_rng(seed)
+    if sample_size is None:
+        sample_size = n_clusters * 64
+    sample = x[rng.choice(len(x), min(len(x), sample_size), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = (sample @ centroids.T).argmax(axis=1)
+        # Sums of cluster members over points sorted by cluster (np.add.at is much slower)
+        counts = np.bincount(assign, minlength=n_clusters)
+        present = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        starts = (np.cumsum(counts) - counts)[present]
+        sums[present] = np.add.reduceat(sample[np.argsort(assign, kind='stable')], starts, axis=0)
+        # Empty clusters are restarted from random points
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = l2_normalize(sums)
+    return centroids
+
+
+class ReidIndex:
+    """
+    Nearest-neighbour search over gallery embeddings by cosine similarity.
+
+    The gallery is L2-normalized once, so similarity of a batch of queries is one matrix multiply and top-k is
+    taken with argpartition. mode='ivf' is an approximate search for large galleries: embeddings are split into
+    n_lists clusters and only n_probe clusters nearest to the query are scanned.
+    """
+
+    def __init__(self, embeddings, labels=None, mode='exact', n_lists=None, n_probe=8, chunk_size=1024, seed=0):
+        if mode not in ('exact', 'ivf'):
+            raise ValueError(f"Unknown mode: {mode}")
+
+        self.mode = mode
+        self.gallery = l2_normalize(embeddings)
+        self.labels = np.asarray(labels) if labels is not None else None
+        self.n_probe = n_probe
+        self.chunk_size = chunk_size
+
+        if mode == 'ivf':
+            if n_lists is None:
+                n_lists = max(1, int(4 * np.sqrt(len(self.gallery))))
+            self.centroids = spherical_kmeans(self.gallery, min(n_lists, len(self.gallery)), seed=seed)
+            self.__build_lists()
+
+    def __len__(self):
+        return len(self.gallery)
+
+    def __build_lists(self):
+        assign = np.concatenate([(self.gallery[start:start + self.chunk_size] @ self.centroids.T).argmax(axis=1)
+                                 for start in range(0, len(self.gallery), self.chunk_size)])
+        # Vectors of a list lie together: ids[offsets[l]:offsets[l + 1]] are gallery rows of list l
+        self.ids = np.argsort(assign, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(self.centroids)))])
+        self.sorted_gallery = self.gallery[self.ids]
+
+    def add(self, embeddings, labels=None):
+        """Add embeddings to the gallery (IVF lists keep their centroids)."""
+        self.gallery = np.concatenate([self.gallery, l2_normalize(embeddings)])
+        if self.labels is not None:
+            self.labels = np.concatenate([self.labels, np.asarray(labels)])
+        if self.mode == 'ivf':
+            self.__build_lists()
+
+    def search(self, queries, k=5):
+        """
+        Args:
+            queries: Array q x dim or a single embedding.
+            k (int): Number of neighbours.
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Cosine similarities and gallery indices, q x k, best first.
+            When there are less than k candidates the rest is filled with -inf and -1.
+        """
+        queries = l2_normalize(np.atleast_2d(queries))
+
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, len(queries), self.chunk_size):
+            chunk = queries[start:start + self.chunk_size]
+            if self.mode == 'exact':
+                chunk_scores, chunk_indices = top_k(chunk @ self.gallery.T, k)
+                scores[start:start + len(chunk), :chunk_scores.shape[1]] = chunk_scores
+                indices[start:start + len(chunk), :chunk_indices.shape[1]] = chunk_indices
+            else:
+                self.__search_ivf(chunk, k, scores[start:start + len(chunk)], indices[start:start + len(chunk)])
+        return scores, indices
+
+    def __search_ivf(self, queries, k, scores, indices):
+        _, probes = top_k(queries @ self.centroids.T, self.n_probe)
+        for i, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if len(rows) == 0:
+                continue
+            candidate_scores, best = top_k((self.sorted_gallery[rows] @ query)[None, :], k)
+            scores[i, :best.shape[1]] = candidate_scores[0]
+            indices[i, :best.shape[1]] = self.ids[rows[best[0]]]
+
+    def labels_of(self, indices):
+        """Labels of found gallery items (None for missing neighbours)."""
+        return [[self.labels[i] if i >= 0 else None for i in row] for row in np.atleast_2d(indices)]
@@ -0,0 +1,3 @@
+INSERT INTO {table} ({columns})
+VALUES %s
+RETURNING {returning}
\ No newline at end of file
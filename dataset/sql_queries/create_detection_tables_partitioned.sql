@@ -0,0 +1,38 @@
+CREATE TABLE IF NOT EXISTS video (
+    id SERIAL PRIMARY KEY,
+    path varchar NOT NULL,
+    fps double precision,
+    started_at timestamp
+);
+
+CREATE INDEX IF NOT EXISTS ix_video_path ON video (path);
+
+
+CREATE TABLE IF NOT EXISTS frame (
+    id SERIAL,
+    video_id INT NOT NULL REFERENCES video(id) ON DELETE CASCADE,
+    frame_num INT NOT NULL,
+    PRIMARY KEY (video_id, id)
+) PARTITION BY RANGE (video_id);
+
+CREATE TABLE IF NOT EXISTS frame_default PARTITION OF frame DEFAULT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS frame_video_id_frame_num_idx ON frame (video_id, frame_num);
+
+
+-- label has no video_id column, so it is range-partitioned by frame_id, not by video.
+-- Frame ids grow as videos are processed, so a frame_id range roughly maps to a group of videos
+-- (frames of videos processed at the same time interleave). The primary key (frame_id, id) already indexes frame_id, and there is no
+-- foreign key to frame because frame's primary key is (video_id, id).
+CREATE TABLE IF NOT EXISTS label (
+    id SERIAL,
+    frame_id INT NOT NULL,
+    x INT NOT NULL,
+    y INT NOT NULL,
+    width INT NOT NULL,
+    height INT NOT NULL,
+    misc JSON,
+    PRIMARY KEY (frame_id, id)
+) PARTITION BY RANGE (frame_id);
+
+CREATE TABLE IF NOT EXISTS label_default PARTITION OF label DEFAULT;
@@ -0,0 +1,2 @@
+CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+FOR VALUES FROM (%start%) TO (%end%)
\ No newline at end of file
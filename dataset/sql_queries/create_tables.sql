@@ -13,4 +13,7 @@ CREATE TABLE IF NOT EXISTS label (
     height INT CHECK (height >= 0 AND height < 65536 AND y + height < 65536),
     misc JSON,
     FOREIGN KEY (image_id) REFERENCES image(id)
-);
\ No newline at end of file
+);
+
+
+CREATE INDEX IF NOT EXISTS label_image_id_idx ON label (image_id);
\ No newline at end of file
@@ -0,0 +1,185 @@
+import ast
+import csv
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import psycopg2_utils
+from async_writer import AsyncDetectionWriter, detections_to_labels
+
+
+@pytest.fixture(autouse=True)
+def plain_sql(monkeypatch):
+    # Quoting identifiers needs a real connection, fake cursors get templates formatted as plain text
+    def compose(self, to_replace, context):
+        return self.text.format(**{key: ', '.join(value) if isinstance(value, list) else value
+                                   for key, value in to_replace.items()}), []
+
+    monkeypatch.setattr(psycopg2_utils.SqlTemplate, 'compose', compose)
+
+
+class FakeDatabase:
+    def __init__(self, fail_times=0, delay=0.0):
+        self.tables = {}
+        self.fail_times = fail_times
+        self.delay = delay
+        self.commits = 0
+        self.lock = threading.Lock()
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.encoding = 'UTF8'
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def mogrify(self, template, args):
+        return repr(tuple(args)).encode()
+
+    def execute(self, query, args=None):
+        query = query.decode()
+        table = query.split()[2]
+        values = ast.literal_eval('[' + query.split('VALUES ')[1].split('\nRETURNING')[0] + ']')
+        rows = self.connection.pending.setdefault(table, [])
+        first_id = len(self.connection.database.tables.get(table, [])) + len(rows) + 1
+        rows.extend(values)
+        self.result = [(*row, first_id + i) for i, row in enumerate(values)]
+
+    def fetchall(self):
+        return self.result
+
+    def copy_expert(self, query, file):
+        table = query.split()[1]
+        self.connection.pending.setdefault(table, []).extend(csv.reader(file))
+
+
+class FakeConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, database):
+        self.database = database
+        self.pending = {}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        database = self.database
+        time.sleep(database.delay)
+        with database.lock:
+            if database.fail_times:
+                database.fail_times -= 1
+                self.pending = {}
+                raise RuntimeError("connection lost")
+            for table, rows in self.pending.items():
+                database.tables.setdefault(table, []).extend(rows)
+            database.commits += 1
+        self.pending = {}
+
+    def rollback(self):
+        self.pending = {}
+
+
+class FakePool:
+    def __init__(self, database):
+        self.database = database
+        self.closed = False
+
+    def getconn(self):
+        return FakeConnection(self.database)
+
+    def putconn(self, conn):
+        pass
+
+    def closeall(self):
+        self.closed = True
+
+
+def test_flush_and_close_write_everything():
+    database = FakeDatabase()
+    pool = FakePool(database)
+    writer = AsyncDetectionWriter(pool=pool, batch_size=100, flush_interval=10.0)
+
+    writer.submit_many('label', [(i, i, 1, 1, {'conf': 0.5}) for i in range(250)],
+                       ['image_id', 'x', 'y', 'width', 'height', 'misc'])
+    writer.flush()
+    assert writer.pending() == 0
+    assert len(database.tables['label']) == 250
+    assert writer.written == writer.submitted == 250
+
+    writer.submit('image', ('a.jpg',), ['path'])
+    writer.close()
+    assert pool.closed
+    assert database.tables['image'] == [['a.jpg']]
+    assert writer.written + writer.dropped + writer.failed == writer.submitted == 251
+
+
+def test_dropped_records_are_counted():
+    database = FakeDatabase(delay=0.05)
+    writer = AsyncDetectionWriter(pool=FakePool(database), pool_size=1, batch_size=10, max_pending=20)
+
+    for i in range(500):
+        writer.submit('image', (f'{i}.jpg',), ['path'])
+    writer.close()
+
+    assert writer.dropped > 0
+    assert writer.written + writer.dropped == writer.submitted == 500
+    assert len(database.tables['image']) == writer.written
+
+
+def test_frames_are_written_with_labels():
+    import numpy as np
+
+    database = FakeDatabase()
+    writer = AsyncDetectionWriter(pool=FakePool(database))
+
+    detections = np.array([(10, 20, 30, 60, 0.9, 1)], dtype=[('x1', np.int32), ('y1', np.int32), ('x2', np.int32),
+                                                             ('y2', np.int32), ('conf', np.float32),
+                                                             ('cls', np.int32)])
+    writer.submit_frame(7, 0, [])
+    writer.submit_frame(7, 1, detections_to_labels(detections, ['cat', 'dog'], [{'track_id': 3}]))
+    writer.close()
+
+    assert database.tables['frame'] == [(7, 0), (7, 1)]
+    assert len(database.tables['label']) == 1
+    frame_id, x, y, width, height, misc = database.tables['label'][0]
+    assert (frame_id, x, y, width, height) == ('2', '10', '20', '20', '40')
+    assert ast.literal_eval(misc.replace('"', "'")) == {'conf': 0.9, 'cls': 1, 'class_name': 'dog', 'track_id': 3}
+    assert database.commits == 1
+
+
+def test_failed_batch_is_retried():
+    database = FakeDatabase(fail_times=2)
+    writer = AsyncDetectionWriter(pool=FakePool(database), max_retries=3, retry_delay=0.01)
+
+    writer.submit('image', ('a.jpg',), ['path'])
+    writer.flush()
+    assert writer.written == 1 and writer.failed == 0
+    assert database.tables['image'] == [['a.jpg']]
+    writer.close()
+
+
+def test_lost_batch_is_kept_for_the_caller():
+    database = FakeDatabase(fail_times=3)
+    writer = AsyncDetectionWriter(pool=FakePool(database), max_retries=1, retry_delay=0.01)
+
+    writer.submit_frame(1, 0, [])
+    writer.flush()
+    assert writer.failed == 1 and writer.written == 0
+    assert len(writer.failed_records) == 1
+    assert isinstance(writer.last_error, RuntimeError)
+
+    assert writer.retry_failed() == 1
+    writer.close()
+    assert writer.failed == 0 and writer.failed_records == []
+    assert writer.written == writer.submitted == 1
+    assert database.tables['frame'] == [(1, 0)]
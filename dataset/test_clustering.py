@@ -0,0 +1,57 @@
+import numpy as np
+
+from clustering import SightingClusterer
+
+
+def make_sightings(n_dogs, per_dog, dim=256, noise=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_dogs, dim))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.permutation(np.repeat(np.arange(n_dogs), per_dog))
+    embeddings = centers[labels] + rng.normal(scale=noise / np.sqrt(dim), size=(len(labels), dim))
+    return embeddings.astype(np.float32), labels
+
+
+def test_cold_start_distinct_sightings():
+    embeddings, _ = make_sightings(8000, 1)
+    clusterer = SightingClusterer(threshold=0.75)
+    ids = clusterer.assign(embeddings)
+
+    assert len(np.unique(ids)) == 8000
+    assert clusterer.unique_count() == 8000
+
+
+def test_cold_start_groups_sightings_of_one_dog():
+    embeddings, labels = make_sightings(2000, 10)
+    clusterer = SightingClusterer(threshold=0.75)
+    ids = clusterer.assign(embeddings, keys=list(range(len(embeddings))))
+
+    assert clusterer.unique_count() == 2000
+    # Every cluster holds one dog and every dog is one cluster
+    assert all(len(np.unique(labels[ids == cluster_id])) == 1 for cluster_id in np.unique(ids))
+    assert all(len(np.unique(ids[labels == label])) == 1 for label in range(2000))
+    assert clusterer.counts.sum() == len(embeddings)
+
+
+def test_incremental_assign_keeps_ids():
+    embeddings, labels = make_sightings(50, 20, seed=1)
+    clusterer = SightingClusterer(threshold=0.75, chunk_size=256)
+    first = clusterer.assign(embeddings[:500])
+    second = clusterer.assign(embeddings[500:])
+
+    assert clusterer.unique_count() == 50
+    first_ids = {label: cluster_id for label, cluster_id in zip(labels[:500], first)}
+    assert all(first_ids[label] == cluster_id for label, cluster_id in zip(labels[500:], second)
+               if label in first_ids)
+
+
+def test_save_load(tmp_path):
+    embeddings, _ = make_sightings(30, 5, seed=2)
+    clusterer = SightingClusterer(threshold=0.75)
+    clusterer.assign(embeddings, keys=[f'crop_{i}.jpg' for i in range(len(embeddings))])
+    clusterer.save(str(tmp_path / 'clusters.npz'))
+
+    loaded = SightingClusterer.load(str(tmp_path / 'clusters.npz'))
+    assert loaded.assignments == clusterer.assignments
+    assert loaded.next_id == clusterer.next_id
+    assert (loaded.assign(embeddings[:10]) == clusterer.assign(embeddings[:10])).all()
@@ -0,0 +1,141 @@
+import csv
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from psycopg2.extensions import adapt
+
+import psycopg2_utils
+from psycopg2_utils import COPY_NULL, load_sql_templates, rows_to_csv
+
+
+def test_rows_to_csv_keeps_empty_strings_apart_from_null():
+    text = rows_to_csv([[None, '', 'a,b', 'say "hi"', '\\N', 3, 0.5, np.int64(7), {'conf': 0.9}]]).read()
+    assert text == '\\N,"","a,b","say ""hi""","\\N",3,0.5,7,"{""conf"": 0.9}"\n'
+
+    # Only the unquoted marker is NULL for COPY, the quoted fields read back as the original strings
+    fields = next(csv.reader([text.rstrip('\n')]))
+    assert fields[:5] == [COPY_NULL, '', 'a,b', 'say "hi"', '\\N']
+
+
+def test_copy_template_uses_null_marker():
+    assert f"NULL '{COPY_NULL}'" in load_sql_templates()['copy_data_to_table'].text
+
+
+class FakeNamedCursor:
+    def __init__(self, rows, description):
+        self.rows = rows
+        self.description = None
+        self._description = description
+
+    def execute(self, query, args=None):
+        self.description = self._description
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+
+class FakeConnection:
+    encoding = 'UTF8'
+
+    def __init__(self, rows=(), description=()):
+        self.rows = list(rows)
+        self.description = [Column(name, type_code) for name, type_code in description]
+        self.commits = 0
+        self.closed = False
+        self.session = {}
+
+    def cursor(self, name=None):
+        return FakeNamedCursor(self.rows, self.description)
+
+    def set_session(self, **kwargs):
+        self.session.update(kwargs)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class Column:
+    def __init__(self, name, type_code):
+        self.name = name
+        self.type_code = type_code
+
+
+def test_iter_data_from_table_streams_on_its_own_connection(monkeypatch):
+    rows = [(1, 'a', 0.5), (2, 'a much longer name', None), (3, 'b', 1.5)]
+    main, reader = FakeConnection(), FakeConnection(rows, [('id', 23), ('name', 25), ('score', 701)])
+    connections = iter([main, reader])
+    monkeypatch.setattr(psycopg2_utils.psycopg2, 'connect', lambda **kwargs: next(connections))
+    monkeypatch.setattr(psycopg2_utils.SqlTemplate, 'compose', lambda self, to_replace, context: ('SELECT', []))
+
+    db = psycopg2_utils.PostgresConnection()
+    db.get_columns_list = lambda table_name: ['id', 'name', 'score']
+    chunks = list(db.iter_data_from_table('dog', fetch_size=1, as_numpy=True))
+
+    # One dtype for all chunks: strings are not truncated to the length of the first chunk
+    assert {chunk.dtype for chunk in chunks} == {np.dtype([('id', np.int32), ('name', object), ('score', np.float64)])}
+    assert [chunk.name[0] for chunk in chunks] == ['a', 'a much longer name', 'b']
+    assert np.isnan(chunks[1].score[0])
+
+    # The caller's transaction is left alone
+    assert main.commits == 0
+    assert reader.closed and reader.session == {'readonly': True}
+
+
+class FakeInsertCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.sql_rows = []
+        self.copied = None
+
+    def mogrify(self, template, args):
+        # Real psycopg2 adaptation, as execute_values does with a connection
+        literals = [adapt(value).getquoted().decode() for value in args]
+        self.sql_rows.append(literals)
+        return ('(' + ','.join(literals) + ')').encode()
+
+    def execute(self, query, args=None):
+        pass
+
+    def fetchall(self):
+        return [(i,) for i in range(len(self.sql_rows))]
+
+    def copy_expert(self, query, file):
+        self.copied = list(csv.reader(file))
+
+
+def test_returning_and_copy_paths_accept_the_same_rows(monkeypatch):
+    connection = FakeConnection()
+    cursor = FakeInsertCursor(connection)
+    connection.cursor = lambda: cursor
+    monkeypatch.setattr(psycopg2_utils.psycopg2, 'connect', lambda **kwargs: connection)
+    monkeypatch.setattr(psycopg2_utils.SqlTemplate, 'compose',
+                        lambda self, to_replace, context: ('INSERT INTO label VALUES %s RETURNING id', []))
+
+    db = psycopg2_utils.PostgresConnection()
+    db.get_columns_list = lambda table_name: ['id', 'frame_id', 'name', 'misc', 'note', 'points']
+    rows = [(np.int64(7), 'dog', {'conf': np.float32(0.5), 'cls': np.int32(1)}, None, [1, 2]),
+            (np.float64(0.25), "it's", {}, 'x', [])]
+    columns = ['frame_id', 'name', 'misc', 'note', 'points']
+
+    assert db.bulk_insert_data_to_table('label', rows, columns) == [0, 1]
+    assert db.bulk_insert_data_to_table('label', rows, columns, returning=None) == 2
+
+    def from_sql(literal):
+        return None if literal == 'NULL' else literal.strip("'").replace("''", "'")
+
+    def from_csv(field):
+        return None if field == COPY_NULL else field
+
+    assert [[from_sql(value) for value in row] for row in cursor.sql_rows] == \
+           [[from_csv(value) for value in row] for row in cursor.copied] == \
+           [['7', 'dog', '{"conf": 0.5, "cls": 1}', None, '[1, 2]'], ['0.25', "it's", '{}', 'x', '[]']]
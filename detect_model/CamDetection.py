@@ -1,13 +1,24 @@
+import contextlib
 import cv2
-import torch
-from PIL import Image
 import pathlib
 import datetime
 import os
+import sys
 
-# Установка правильного пути для Windows
+# Общая постобработка детекций лежит в models/detection
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'detection'))
+from backends import Yolov5HubBackend
+from model_registry import load_model
+from postprocess import class_names_of, draw_detections, make_labels, to_detections
+from tracker import Tracker
+
+from detection_sink import DetectionSink
+from frame_gate import FrameGate
+
+# Установка правильного пути для Windows (веса сохранены на Linux)
 temp = pathlib.PosixPath
-pathlib.PosixPath = pathlib.WindowsPath
+if os.name == 'nt':
+    pathlib.PosixPath = pathlib.WindowsPath
 
 # Список классов
 class_names = [
@@ -40,60 +51,92 @@ class_names = [
 
 
 class DogDetector:
-    def __init__(self, model_file_path, max_width=800, max_height=600):
+    def __init__(self, model_file_path, max_width=800, max_height=600, frame_gate=None, output_dir='cropped_images',
+                 verbose=True, db_writer=None, source_name='camera:0'):
+        """
+        :param db_writer: async_writer.AsyncDetectionWriter для записи детекций в таблицы video/frame/label;
+                          запись идёт в фоне и не замедляет захват кадров
+        :param source_name: имя источника, под которым видео записывается в таблицу video
+        """
         self.model_path = model_file_path
         self.max_width = max_width
         self.max_height = max_height
-        self.model = self.load_model()
+        self.verbose = verbose
+        self.backend = self.load_model()
+
+        # Необязательный отбор кадров для модели (FrameGate); None — модель запускается на каждом кадре
+        self.frame_gate = frame_gate
+        self.last_detections = None
+        self.last_labels = None
+
+        # Трекер объединяет детекции одной собаки на соседних кадрах в трек
+        self.tracker = Tracker()
 
-        # Создание папки для сохранения изображений
-        self.output_dir = 'cropped_images'
-        os.makedirs(self.output_dir, exist_ok=True)
+        # Фоновое сохранение обрезанных изображений и журнала детекций
+        self.output_dir = output_dir
+        self.sink = DetectionSink(self.output_dir, console=verbose)
+
+        # Номер текущего кадра потока (считаются все кадры, включая пропущенные FrameGate)
+        self.frame_num = -1
+        self.db_writer = db_writer
+        self.video_id = None
+        if db_writer is not None:
+            self.video_id = db_writer.open_video(source_name, started_at=datetime.datetime.now())
 
     def load_model(self):
         print("Загрузка модели...")
-        return torch.hub.load('ultralytics/yolov5', 'custom', path=self.model_path, force_reload=True, device="cpu")
-
-    def detect_objects(self, frame):
-        print("Выполняется детекция объектов...")
-        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))  # Преобразование в формат RGB для модели
-        results = self.model(img)
-        detections = results.xyxy[0].numpy()
-
-        for result in detections:
-            x1, y1, x2, y2, conf, cls = result[:6]
-            if conf > 0.25:  # Порог уверенности
-                # Определение класса объекта
-                detected_class = class_names[int(cls)] if int(cls) < len(class_names) else "Unknown"
-
-                # Отрисовка прямоугольника вокруг объекта
-                frame = cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                label = f'{detected_class}: {conf * 100:.2f}%'
-                frame = cv2.putText(frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-                # Обрезка изображения по координатам
-                cropped_image = frame[int(y1):int(y2), int(x1):int(x2)]
-
-                # Сохранение обрезанного изображения
-                timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-                cropped_photo_path = os.path.join(self.output_dir,
-                                                  f'{detected_class}_{timestamp}_{int(x1), int(y1), int(x2), int(y2)}.jpg')
-                cv2.imwrite(cropped_photo_path, cropped_image)
-
-                # Сохранение информации в текстовый файл
-                log_path = os.path.join(self.output_dir, 'detections_log.txt')
-                with open(log_path, 'a') as log_file:
-                    log_file.write(
-                        f"Время: {timestamp}, Класс: {detected_class}, Координаты: x1={int(x1)}, y1={int(y1)}, x2={int(x2)}, y2={int(y2)}\n"
-                    )
-
-                # Вывод в консоль
-                print(f"Собака обнаружена! Время: {timestamp}, Класс: {detected_class}")
-                print(f"Координаты: x1={int(x1)}, y1={int(y1)}, x2={int(x2)}, y2={int(y2)}")
-                print(f"Обрезанное изображение сохранено: {cropped_photo_path}")
-
+        return Yolov5HubBackend(load_model(self.model_path, kind='yolov5', device="cpu"))
+
+    def detect_objects(self, frame, inference_slot=None):
+        if self.verbose:
+            print("Выполняется детекция объектов...")
+        # Слот занят только на время запуска модели: трекинг, запись и отрисовка идут без него
+        with inference_slot if inference_slot is not None else contextlib.nullcontext():
+            predictions = self.backend.predict([frame])[0]
+        detections = to_detections(predictions, conf_threshold=0.25)  # Порог уверенности
+
+        # Трекер сам вырезает лучшее изображение каждого трека из кадра без разметки
+        track_ids, finished_tracks = self.tracker.update(detections, frame)
+        self.report_tracks(finished_tracks)
+
+        if self.db_writer is not None:
+            self.db_writer.submit_detections(self.video_id, self.frame_num, detections, class_names,
+                                             [{'track_id': track_id} for track_id in track_ids.tolist()])
+
+        # Отрисовка прямоугольников вокруг объектов
+        labels = [f'#{track_id} {label}' for track_id, label in
+                  zip(track_ids.tolist(), make_labels(detections, '{name}: {conf:.2%}', class_names))]
+        frame = draw_detections(frame, detections, labels)
+
+        self.last_detections, self.last_labels = detections, labels
         return frame
 
+    def report_tracks(self, tracks):
+        # По каждой собаке сохраняется одно лучшее изображение и одна запись в журнале
+        if not tracks:
+            return
+        detected_classes = class_names_of([track.best_cls for track in tracks], class_names)
+        for track, detected_class in zip(tracks, detected_classes):
+            self.sink.submit(track.best_crop, {
+                'time': self._format_time(track.first_seen),
+                'last_seen': self._format_time(track.last_seen),
+                'track_id': track.track_id,
+                'class': detected_class,
+                'conf': round(track.best_conf, 4),
+                'box': track.best_box,
+                'frames': track.hits,
+            })
+
+    @staticmethod
+    def _format_time(timestamp):
+        return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d_%H-%M-%S-%f')
+
+    def draw_last_detections(self, frame):
+        # На кадрах без запуска модели показываем рамки с последнего обработанного кадра
+        if self.last_detections is None:
+            return frame
+        return draw_detections(frame, self.last_detections, self.last_labels)
+
     def resize_frame(self, frame):
         height, width = frame.shape[:2]
         if width > self.max_width or height > self.max_height:
@@ -102,6 +145,24 @@ class DogDetector:
 
         return frame
 
+    def process_frame(self, frame, inference_slot=None):
+        """
+        Обработка одного кадра потока: детекция (если FrameGate её разрешает) и отрисовка рамок.
+        :param inference_slot: контекстный менеджер, ограничивающий число одновременных запусков модели
+        :return: (кадр с разметкой, запускалась ли модель)
+        """
+        self.frame_num += 1
+        if self.frame_gate is not None and not self.frame_gate.should_infer(frame):
+            return self.draw_last_detections(frame), False
+
+        return self.detect_objects(frame, inference_slot=inference_slot), True
+
+    def close(self):
+        self.report_tracks(self.tracker.flush())  # Собаки, которые всё ещё в кадре
+        self.sink.close()  # Дописываем оставшиеся изображения и журнал
+        if self.frame_gate is not None and self.verbose:
+            print("Статистика кадров:", self.frame_gate.stats())
+
     def run(self):
         cap = cv2.VideoCapture(0)  # Открытие видеопотока с веб-камеры (0 — для стандартной камеры)
         if not cap.isOpened():
@@ -109,29 +170,58 @@ class DogDetector:
             return
 
         print("Нажмите 'q', чтобы выйти.")
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                print("Не удалось захватить кадр!")
-                break
-
-            frame = self.detect_objects(frame)  # Выполнение детекции объектов
-            frame = self.resize_frame(frame)  # Масштабирование кадра
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    print("Не удалось захватить кадр!")
+                    break
 
-            cv2.imshow('YOLOv5 Dog Detection (Live)', frame)  # Отображение текущего кадра
+                frame, _ = self.process_frame(frame)  # Выполнение детекции объектов
+                frame = self.resize_frame(frame)  # Масштабирование кадра
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):  # Выход при нажатии 'q'
-                break
+                cv2.imshow('YOLOv5 Dog Detection (Live)', frame)  # Отображение текущего кадра
 
-        cap.release()  # Освобождение ресурса камеры
-        cv2.destroyAllWindows()  # Закрытие всех окон
+                if cv2.waitKey(1) & 0xFF == ord('q'):  # Выход при нажатии 'q'
+                    break
+        finally:
+            cap.release()  # Освобождение ресурса камеры
+            cv2.destroyAllWindows()  # Закрытие всех окон
+            self.close()
 
 
 if __name__ == '__main__':
-    # Определение пути к модели
-    model_path = r'C:\Users\Samsung\Dog-detection\best.pt'
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Детекция собак с веб-камеры")
+    parser.add_argument('--model', default=r'C:\Users\Samsung\Dog-detection\best.pt', help="Путь к модели")
+    parser.add_argument('--every-k', type=int, default=1, help="Запускать модель раз в K кадров")
+    parser.add_argument('--motion-gate', action='store_true', help="Не запускать модель на кадрах без движения")
+    parser.add_argument('--db', action='store_true',
+                        help="Записывать детекции в таблицы video/frame/label (параметры подключения берутся из .env, "
+                             "таблицы должны быть созданы заранее, см. dataset/detection_results_tables.py)")
+    args = parser.parse_args()
+
+    # Отбор кадров включается только явно
+    gate = None
+    if args.motion_gate or args.every_k > 1:
+        gate = FrameGate(every_k=args.every_k, motion_gate=args.motion_gate)
+
+    db_writer = contextlib.nullcontext()
+    if args.db:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset'))
+        from dotenv import load_dotenv
+        from async_writer import AsyncDetectionWriter
+
+        load_dotenv()
+        db_writer = AsyncDetectionWriter(host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"),
+                                         user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWD"))
 
     # Создание и запуск экземпляра DogDetector
-    detector = DogDetector(model_file_path=model_path)
-    detector.run()
-
+    with db_writer:
+        detector = DogDetector(model_file_path=args.model, frame_gate=gate,
+                               db_writer=db_writer if args.db else None)
+        detector.run()
+    if args.db:
+        print(f"Записано кадров: {db_writer.written}, пропущено: {db_writer.dropped}, "
+              f"не удалось записать: {db_writer.failed}")
@@ -1,13 +1,20 @@
 import cv2
-import torch
-from PIL import Image
 import pathlib
 import datetime
+import os
+import sys
 from tkinter import Tk, filedialog
 
-# Установка правильного пути для Windows
+# Установка правильного пути для Windows (веса сохранены на Linux)
 temp = pathlib.PosixPath
-pathlib.PosixPath = pathlib.WindowsPath
+if os.name == 'nt':
+    pathlib.PosixPath = pathlib.WindowsPath
+
+# Общая постобработка детекций лежит в models/detection
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'detection'))
+from backends import Yolov5HubBackend
+from model_registry import load_model
+from postprocess import crop_detections, draw_detections, to_detections
 
 
 class DogDetector:
@@ -15,11 +22,11 @@ class DogDetector:
         self.model_path = model_file_path
         self.max_width = max_width
         self.max_height = max_height
-        self.model = self.load_model()
+        self.backend = self.load_model()
 
     def load_model(self):
         print("Загрузка модели...")
-        return torch.hub.load('ultralytics/yolov5', 'custom', path=self.model_path, force_reload=True, device="cpu")
+        return Yolov5HubBackend(load_model(self.model_path, kind='yolov5', device="cpu"))
 
     @staticmethod
     def load_image():
@@ -36,23 +43,13 @@ class DogDetector:
 
     def detect_objects(self, frame):
         print("Выполняется детекция объектов...")
-        img = Image.fromarray(frame)
-        results = self.model(img)
-        detections = results.xyxy[0].numpy()
-
-        cropped_images = []  # Список для хранения обрезанных изображений
-
-        for result in detections:
-            x1, y1, x2, y2, conf, cls = result[:6]
-            if conf > 0.25:
-                # Вывод коэффициента уверенности в консоль
+        detections = to_detections(self.backend.predict([frame])[0], conf_threshold=0.25)
 
-                # Отрисовка прямоугольника вокруг объекта
-                frame = cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
+        # Отрисовка прямоугольников вокруг объектов
+        frame = draw_detections(frame, detections)
 
-                # Обрезка изображения по области объекта и добавление в список
-                cropped_img = frame[int(y1):int(y2), int(x1):int(x2)]
-                cropped_images.append((cropped_img, conf))
+        # Обрезанные изображения по областям объектов вместе с уверенностью
+        cropped_images = list(zip(crop_detections(frame, detections), detections['conf'].tolist()))
 
         return frame, cropped_images
 
@@ -102,8 +99,9 @@ class DogDetector:
         self.save_cropped_images(cropped_images)  # Сохранение обрезанных изображений
 
 
-# Определение пути к модели
-model_path = r'C:\Users\Samsung\Dog-detection\best.pt'
-# Создание и запуск экземпляра DogDetector
-detector = DogDetector(model_file_path=model_path)
-detector.run()
+if __name__ == '__main__':
+    # Определение пути к модели
+    model_path = r'C:\Users\Samsung\Dog-detection\best.pt'
+    # Создание и запуск экземпляра DogDetector
+    detector = DogDetector(model_file_path=model_path)
+    detector.run()
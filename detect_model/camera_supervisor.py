@@ -0,0 +1,215 @@
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+# Интервал между отчётами воркеров о своей работе (секунды)
+REPORT_INTERVAL = 5.0
+
+
+def parse_source(source):
+    # Номера устройств передаются числами, файлы и RTSP-адреса — строками
+    return int(source) if str(source).isdigit() else source
+
+
+def _capture(cap, frames, stop_event, finished_event, live, counters):
+    # Для живых потоков старые кадры выбрасываются, чтобы обработка не отставала от камеры;
+    # для файлов чтение ждёт, пока освободится место в очереди
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if live:
+            while True:
+                try:
+                    frames.put_nowait(frame)
+                    break
+                except queue.Full:
+                    try:
+                        frames.get_nowait()
+                        counters['dropped'] += 1
+                    except queue.Empty:
+                        pass
+        else:
+            while not stop_event.is_set():
+                try:
+                    frames.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    finished_event.set()
+
+
+def camera_worker(camera_id, source, model_path, inference_slots, stats_queue, stop_event, options):
+    """
+    Процесс-воркер одной камеры: захват кадров в отдельном потоке и детекция в основном.
+    Модель запускается только после получения слота из общего для всех камер семафора inference_slots.
+    """
+    import torch
+    from CamDetection import DogDetector
+    from frame_gate import FrameGate
+
+    # Ядра делятся между камерами через слоты, поэтому одному запуску модели хватает нескольких потоков
+    torch.set_num_threads(options['threads_per_slot'])
+    cv2.setNumThreads(1)
+
+    gate = None
+    if options['motion_gate'] or options['every_k'] > 1:
+        gate = FrameGate(every_k=options['every_k'], motion_gate=options['motion_gate'])
+    detector = DogDetector(model_file_path=model_path, frame_gate=gate,
+                           output_dir=os.path.join(options['output_dir'], f'camera_{camera_id}'), verbose=False)
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        stats_queue.put({'camera': camera_id, 'source': str(source), 'error': "не удалось открыть источник"})
+        detector.close()
+        return
+
+    live = not (isinstance(source, str) and os.path.isfile(source))
+    frames = queue.Queue(maxsize=options['queue_size'])
+    counters = {'dropped': 0}
+    capture_stop, capture_finished = threading.Event(), threading.Event()
+    capture_thread = threading.Thread(target=_capture, args=(cap, frames, capture_stop, capture_finished, live, counters),
+                                      daemon=True)
+    capture_thread.start()
+
+    processed = inferred = 0
+    window_start, window_frames = time.perf_counter(), 0
+    try:
+        while not stop_event.is_set():
+            try:
+                frame = frames.get(timeout=0.5)
+            except queue.Empty:
+                # Источник закончился и все захваченные кадры обработаны
+                if capture_finished.is_set() and frames.empty():
+                    break
+                continue
+
+            _, did_infer = detector.process_frame(frame, inference_slot=inference_slots)
+            processed += 1
+            inferred += did_infer
+            window_frames += 1
+
+            elapsed = time.perf_counter() - window_start
+            if elapsed >= REPORT_INTERVAL:
+                stats_queue.put({'camera': camera_id, 'source': str(source), 'fps': window_frames / elapsed,
+                                 'queue_depth': frames.qsize(), 'processed': processed, 'inferred': inferred,
+                                 'dropped': counters['dropped']})
+                window_start, window_frames = time.perf_counter(), 0
+    finally:
+        capture_stop.set()
+        capture_thread.join()
+        cap.release()
+        detector.close()
+        stats_queue.put({'camera': camera_id, 'source': str(source), 'finished': True, 'processed': processed,
+                         'inferred': inferred, 'dropped': counters['dropped']})
+
+
+class CameraSupervisor:
+    """
+    Запуск детекции для нескольких источников (камеры, видеофайлы, RTSP): по одному процессу на источник.
+
+    Ядра процессора делятся между камерами через семафор слотов инференса: одновременно модель
+    выполняется не более чем в inference_slots процессах. Воркеры периодически присылают частоту
+    обработки кадров и глубину очереди захвата, супервизор печатает сводку.
+    """
+
+    def __init__(self, sources, model_path, inference_slots=None, threads_per_slot=None, queue_size=8,
+                 output_dir='cropped_images', every_k=1, motion_gate=False):
+        self.sources = [parse_source(source) for source in sources]
+        self.model_path = model_path
+
+        cpu_count = os.cpu_count() or 1
+        self.inference_slots = inference_slots or max(1, cpu_count // 2)
+        self.options = {
+            'threads_per_slot': threads_per_slot or max(1, cpu_count // self.inference_slots),
+            'queue_size': queue_size,
+            'output_dir': output_dir,
+            'every_k': every_k,
+            'motion_gate': motion_gate,
+        }
+        self.stats = {}
+
+    def run(self):
+        context = mp.get_context('spawn')
+        slots = context.BoundedSemaphore(self.inference_slots)
+        stats_queue = context.Queue()
+        stop_event = context.Event()
+
+        workers = [context.Process(target=camera_worker, name=f'camera-{camera_id}',
+                                   args=(camera_id, source, self.model_path, slots, stats_queue, stop_event,
+                                         self.options))
+                   for camera_id, source in enumerate(self.sources)]
+        for worker in workers:
+            worker.start()
+        print(f"Запущено камер: {len(workers)}, слотов инференса: {self.inference_slots}, "
+              f"потоков на слот: {self.options['threads_per_slot']}")
+
+        finished = set()
+        last_report = time.perf_counter()
+        try:
+            while len(finished) < len(workers):
+                idle = False
+                try:
+                    message = stats_queue.get(timeout=1.0)
+                    self.stats.setdefault(message['camera'], {}).update(message)
+                    if message.get('finished') or message.get('error'):
+                        finished.add(message['camera'])
+                except queue.Empty:
+                    idle = True
+
+                # Воркер мог упасть, не успев ничего сообщить; проверяем на каждой итерации,
+                # иначе сообщения живых камер не дают заметить упавшую. Последнее сообщение
+                # штатно завершившегося воркера может ещё лежать в очереди, его ждём до опустошения очереди
+                for camera_id, worker in enumerate(workers):
+                    if not worker.is_alive() and camera_id not in finished and (worker.exitcode != 0 or idle):
+                        self.stats.setdefault(camera_id, {}).update({'source': str(self.sources[camera_id]),
+                                                                      'error': f"код выхода {worker.exitcode}"})
+                        finished.add(camera_id)
+
+                if time.perf_counter() - last_report >= REPORT_INTERVAL:
+                    self.print_report()
+                    last_report = time.perf_counter()
+        except KeyboardInterrupt:
+            print("Остановка камер...")
+        finally:
+            stop_event.set()
+            for worker in workers:
+                worker.join()
+            self.print_report()
+
+        return self.stats
+
+    def print_report(self):
+        print(f"{'камера':<7} {'кадр/с':>7} {'очередь':>8} {'кадров':>8} {'модель':>8} {'пропущено':>10}  источник")
+        for camera_id in sorted(self.stats):
+            stats = self.stats[camera_id]
+            if stats.get('error'):
+                print(f"{camera_id:<7} ошибка: {stats['error']}  {stats['source']}")
+                continue
+            state = ' (завершена)' if stats.get('finished') else ''
+            print(f"{camera_id:<7} {stats.get('fps', 0.0):>7.1f} {stats.get('queue_depth', 0):>8} "
+                  f"{stats.get('processed', 0):>8} {stats.get('inferred', 0):>8} {stats.get('dropped', 0):>10}  "
+                  f"{stats['source']}{state}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Детекция собак на нескольких камерах")
+    parser.add_argument('sources', nargs='+', help="Источники: номера камер, пути к видео или RTSP-адреса")
+    parser.add_argument('--model', default=r'C:\Users\Samsung\Dog-detection\best.pt', help="Путь к модели")
+    parser.add_argument('--slots', type=int, default=None, help="Сколько камер могут одновременно выполнять модель")
+    parser.add_argument('--threads-per-slot', type=int, default=None, help="Потоков PyTorch на один запуск модели")
+    parser.add_argument('--queue-size', type=int, default=8, help="Размер очереди захваченных кадров на камеру")
+    parser.add_argument('--output-dir', default='cropped_images', help="Каталог для изображений и журналов")
+    parser.add_argument('--every-k', type=int, default=1, help="Запускать модель раз в K кадров")
+    parser.add_argument('--motion-gate', action='store_true', help="Не запускать модель на кадрах без движения")
+    args = parser.parse_args()
+
+    supervisor = CameraSupervisor(args.sources, args.model, inference_slots=args.slots,
+                                  threads_per_slot=args.threads_per_slot, queue_size=args.queue_size,
+                                  output_dir=args.output_dir, every_k=args.every_k, motion_gate=args.motion_gate)
+    supervisor.run()
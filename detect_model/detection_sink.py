@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import cv2
+
+_log = logging.getLogger(__name__)
+
+
+class _JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, ensure_ascii=False)
+
+
+class _EventQueueHandler(QueueHandler):
+    # Стандартный QueueHandler превращает сообщение в строку, а форматтерам нужен исходный словарь события
+    def prepare(self, record):
+        return record
+
+
+class _ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        event = record.msg
+        x1, y1, x2, y2 = event['box']
+        track = f", Трек: {event['track_id']}" if event.get('track_id') is not None else ''
+        return (f"Собака обнаружена! Время: {event['time']}, Класс: {event['class']}{track}\n"
+                f"Координаты: x1={x1}, y1={y1}, x2={x2}, y2={y2}\n"
+                f"Обрезанное изображение сохранено: {event['crop_path']}")
+
+
+class DetectionSink:
+    """
+    Фоновое сохранение результатов детекции: обрезанные изображения и журнал в формате JSON lines.
+
+    Методы submit() не обращаются к диску и не блокируют поток захвата кадров:
+    изображения кодируются и записываются пулом потоков, журнал пишется отдельным потоком
+    с ротацией файлов по размеру. Если очередь изображений переполнена, изображение
+    пропускается (событие в журнал всё равно попадает, счётчик dropped увеличивается).
+    Ошибки кодирования и записи изображений не останавливают потоки: они попадают в лог и в счётчик failed.
+    """
+
+    def __init__(self, output_dir, workers=2, max_pending=256, batch_size=16,
+                 log_name='detections_log.jsonl', max_log_bytes=10 * 1024 * 1024, log_backups=5, console=True):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._stats_lock = threading.Lock()
+
+        # Пул потоков для кодирования и записи изображений
+        self._crops = queue.Queue(maxsize=max_pending)
+        self._workers = [threading.Thread(target=self._write_crops, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+        # Журнал детекций: запись в файл выполняет поток QueueListener
+        file_handler = RotatingFileHandler(os.path.join(self.output_dir, log_name), maxBytes=max_log_bytes,
+                                           backupCount=log_backups, encoding='utf-8')
+        file_handler.setFormatter(_JsonLinesFormatter())
+        handlers = [file_handler]
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(_ConsoleFormatter())
+            handlers.append(console_handler)
+
+        self._log_queue = queue.SimpleQueue()
+        self._listener = QueueListener(self._log_queue, *handlers)
+        self._listener.start()
+
+        self._logger = logging.getLogger(f'{__name__}.{id(self)}')
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(_EventQueueHandler(self._log_queue))
+
+    def submit(self, crop, event):
+        """
+        Поставить в очередь обрезанное изображение и событие детекции.
+        :param crop: изображение BGR (копируется, исходный кадр можно изменять дальше) или None
+        :param event: словарь с полями события; поле crop_path заполняется автоматически
+        """
+        event = dict(event)
+        event['crop_path'] = None
+        if crop is not None and crop.size:
+            crop_path = os.path.join(self.output_dir, self._crop_name(event))
+            try:
+                self._crops.put_nowait((crop_path, crop.copy()))
+                event['crop_path'] = crop_path
+            except queue.Full:
+                with self._stats_lock:
+                    self.dropped += 1
+
+        self._logger.info(event)
+
+    def close(self):
+        """Дождаться записи всех изображений и журнала и остановить фоновые потоки."""
+        # Ждём места в очереди, только пока есть живые потоки, которые её разбирают
+        for _ in self._workers:
+            while any(worker.is_alive() for worker in self._workers):
+                try:
+                    self._crops.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+        for worker in self._workers:
+            worker.join()
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write_crops(self):
+        while True:
+            # Забираем из очереди сразу пачку изображений, чтобы реже переключаться между потоками
+            batch = [self._crops.get()]
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._crops.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            written = 0
+            for crop_path, crop in batch:
+                try:
+                    ok, encoded = cv2.imencode('.jpg', crop)
+                    if not ok:
+                        raise ValueError("не удалось закодировать изображение")
+                    encoded.tofile(crop_path)
+                    written += 1
+                except Exception as error:
+                    _log.warning("Изображение %s не сохранено: %s", crop_path, error)
+            with self._stats_lock:
+                self.written += written
+                self.failed += len(batch) - written
+
+            if stop:
+                return
+
+    @staticmethod
+    def _crop_name(event):
+        x1, y1, x2, y2 = event['box']
+        track = f"_track{event['track_id']}" if event.get('track_id') is not None else ''
+        return f"{event['class']}_{event['time']}{track}_{x1}_{y1}_{x2}_{y2}.jpg"
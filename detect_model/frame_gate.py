@@ -0,0 +1,85 @@
+import cv2
+
+
+class FrameGate:
+    """
+    Решает, нужно ли запускать модель на очередном кадре живого потока.
+
+    Сначала кадр проверяется дешёвым детектором движения: уменьшенная серая копия кадра
+    сравнивается со скользящим средним фона. Если движения нет, кадр отсекается (gated).
+    Кадры с движением дополнительно прореживаются: модель запускается не чаще, чем раз в every_k кадров
+    (skipped). На отсечённых и пропущенных кадрах вызывающий код использует предыдущие рамки.
+    """
+
+    def __init__(self, every_k=1, motion_gate=True, motion_threshold=25, min_motion_ratio=0.002,
+                 background_rate=0.05, downscale_width=160, max_idle_frames=None):
+        """
+        :param every_k: запускать модель не чаще, чем раз в every_k кадров
+        :param motion_gate: включить отсечение кадров без движения
+        :param motion_threshold: порог разницы яркости пикселя с фоном (0-255)
+        :param min_motion_ratio: доля изменившихся пикселей, начиная с которой считается, что движение есть
+        :param background_rate: скорость обновления фона (чем меньше, тем дольше помнится фон)
+        :param downscale_width: ширина уменьшенной копии кадра для детектора движения
+        :param max_idle_frames: принудительно запускать модель, если движения не было столько кадров подряд
+        """
+        self.every_k = max(1, every_k)
+        self.motion_gate = motion_gate
+        self.motion_threshold = motion_threshold
+        self.min_motion_ratio = min_motion_ratio
+        self.background_rate = background_rate
+        self.downscale_width = downscale_width
+        self.max_idle_frames = max_idle_frames
+
+        self.gated = 0
+        self.skipped = 0
+        self.inferred = 0
+
+        self._background = None
+        self._idle_frames = 0
+        self._since_inference = self.every_k
+
+    def should_infer(self, frame):
+        """Вернуть True, если на этом кадре нужно запустить модель. Обновляет счётчики."""
+        self._since_inference += 1
+
+        if self.motion_gate and not self._has_motion(frame):
+            self._idle_frames += 1
+            if self.max_idle_frames is None or self._idle_frames < self.max_idle_frames:
+                self.gated += 1
+                return False
+        self._idle_frames = 0
+
+        if self._since_inference < self.every_k:
+            self.skipped += 1
+            return False
+
+        self._since_inference = 0
+        self.inferred += 1
+        return True
+
+    def stats(self):
+        total = self.gated + self.skipped + self.inferred
+        return {'total': total, 'gated': self.gated, 'skipped': self.skipped, 'inferred': self.inferred}
+
+    def reset(self):
+        self.gated = self.skipped = self.inferred = 0
+        self._background = None
+        self._idle_frames = 0
+        self._since_inference = self.every_k
+
+    def _has_motion(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.downscale_width / width
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._background is None:
+            # Первый кадр: фона ещё нет, считаем, что движение есть
+            self._background = gray.astype('float32')
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        cv2.accumulateWeighted(gray, self._background, self.background_rate)
+
+        changed = cv2.countNonZero(cv2.threshold(diff, self.motion_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed >= self.min_motion_ratio * diff.size
@@ -0,0 +1,174 @@
+import abc
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from model_registry import load_model, registry
+from postprocess import nms
+
+# Названия бэкендов, которые понимает create_backend()
+BACKENDS = ('eager', 'onnx', 'onnx-int8')
+
+
+class InferenceBackend(abc.ABC):
+    """
+    Общий интерфейс моделей детекции.
+
+    predict() принимает список кадров BGR и возвращает для каждого кадра массив N x 6
+    (x1, y1, x2, y2, conf, cls) в координатах исходного кадра. Фильтрация по порогу уверенности
+    и перевод в структурированный массив выполняются в postprocess.to_detections().
+    """
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def predict(self, frames):
+        pass
+
+    def __call__(self, frames):
+        return self.predict(frames)
+
+
+class SynchronizedBackend(InferenceBackend):
+    """
+    Бэкенд, общий для нескольких потоков: вызовы predict() выполняются по одному.
+    Предикторы ultralytics не потокобезопасны, а декодирование и отрисовка в конвейерах идут параллельно и без блокировки.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self._lock = threading.Lock()
+
+    def predict(self, frames):
+        with self._lock:
+            return self.backend.predict(frames)
+
+
+class UltralyticsBackend(InferenceBackend):
+    """Модель ultralytics.YOLO в обычном режиме PyTorch (или загруженная из TorchScript/ONNX средствами ultralytics)."""
+
+    name = 'eager'
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, frames):
+        return [r.boxes.data.cpu().numpy() for r in self.model(frames, verbose=False)]
+
+
+class Yolov5HubBackend(InferenceBackend):
+    """Модель YOLOv5, загруженная через torch.hub."""
+
+    name = 'yolov5'
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, frames):
+        # Модели YOLOv5 из torch.hub ожидают изображения в формате RGB
+        images = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+        results = self.model(images)
+        return [xyxy.cpu().numpy() for xyxy in results.xyxy]
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    Модель ultralytics, экспортированная в ONNX и выполняемая в ONNX Runtime на CPU.
+
+    Предобработка (letterbox до imgsz x imgsz) и подавление немаксимумов выполняются на numpy,
+    поэтому PyTorch для инференса не нужен.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, onnx_path, threads=None, imgsz=640, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads or os.cpu_count()
+        options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+
+    def predict(self, frames):
+        batch, transforms = zip(*(self._letterbox(frame) for frame in frames))
+        # Выход ultralytics: (batch, 4 + nc, anchors), рамки в формате (cx, cy, w, h)
+        outputs = self.session.run(None, {self.input_name: np.stack(batch)})[0]
+        return [self._decode(output, transform) for output, transform in zip(outputs, transforms)]
+
+    def _letterbox(self, frame):
+        height, width = frame.shape[:2]
+        ratio = min(self.imgsz / height, self.imgsz / width)
+        new_width, new_height = round(width * ratio), round(height * ratio)
+        pad_x, pad_y = (self.imgsz - new_width) / 2, (self.imgsz - new_height) / 2
+
+        resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        top, left = round(pad_y - 0.1), round(pad_x - 0.1)
+        image = cv2.copyMakeBorder(resized, top, self.imgsz - new_height - top, left, self.imgsz - new_width - left,
+                                   cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).transpose(2, 0, 1)
+        return np.ascontiguousarray(image, dtype=np.float32) / 255.0, (ratio, left, top, width, height)
+
+    def _decode(self, output, transform):
+        ratio, left, top, width, height = transform
+        predictions = output.T
+        scores = predictions[:, 4:]
+        classes = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), classes]
+
+        mask = confidences > self.conf_threshold
+        predictions, classes, confidences = predictions[mask], classes[mask], confidences[mask]
+
+        cx, cy, w, h = predictions[:, :4].T
+        boxes = np.column_stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+        keep = nms(boxes, confidences, classes, self.iou_threshold, self.max_det)
+        boxes, confidences, classes = boxes[keep], confidences[keep], classes[keep]
+
+        # Возвращаемся к координатам исходного кадра
+        boxes = (boxes - [left, top, left, top]) / ratio
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return np.column_stack([boxes, confidences, classes]).astype(np.float32)
+
+
+def export_onnx(weights, int8=False):
+    """
+    Путь к ONNX-версии модели; экспорт и квантование выполняются один раз и кэшируются по хэшу весов.
+    :param int8: динамическое квантование весов в INT8
+    """
+    onnx_path = registry.export_artifact(weights, 'onnx')
+    if not int8:
+        return onnx_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = registry.artifact_path(weights, 'onnx', tag='-int8')
+    if not os.path.exists(int8_path):
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+def create_backend(weights, backend='eager', threads=None, imgsz=640):
+    """
+    Создать бэкенд инференса для весов ultralytics.
+    :param backend: 'eager' — PyTorch, 'onnx' — ONNX Runtime, 'onnx-int8' — ONNX Runtime с INT8-весами
+    :param threads: число потоков ONNX Runtime (по умолчанию — все ядра)
+    """
+    if backend == 'eager':
+        return UltralyticsBackend(load_model(weights))
+    if backend in ('onnx', 'onnx-int8'):
+        instance = OnnxRuntimeBackend(export_onnx(weights, int8=backend == 'onnx-int8'), threads=threads, imgsz=imgsz)
+        instance.name = backend
+        return instance
+    raise ValueError(f"Неизвестный бэкенд: {backend}. Доступны: {', '.join(BACKENDS)}")
@@ -0,0 +1,196 @@
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+from backends import BACKENDS, create_backend
+from postprocess import iou_matrix
+
+# Файл с описанием датасета по умолчанию (тот же, что используется для обучения)
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'detect_model', 'dataset.yaml')
+
+# Пороги IoU для mAP50-95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов инференса на CPU")
+    parser.add_argument("--weights", default="best.pt", help="Путь к весам YOLO")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="Описание датасета (dataset.yaml)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS), help="Бэкенды для сравнения")
+    parser.add_argument("--images", type=int, default=100, help="Количество изображений из валидационной выборки")
+    parser.add_argument("--batch-size", type=int, default=8, help="Размер пакета для замера пропускной способности")
+    parser.add_argument("--threads", type=int, default=None, help="Число потоков ONNX Runtime")
+    parser.add_argument("--warmup", type=int, default=5, help="Количество прогревочных запусков")
+    parser.add_argument("--no-map", action="store_true", help="Не считать mAP (только скорость)")
+    parser.add_argument("--map-images", type=int, default=None,
+                        help="Количество изображений валидационной выборки для mAP (по умолчанию — все)")
+    return parser.parse_args()
+
+
+def validation_paths(data_file, limit=None):
+    with open(data_file, 'r') as file:
+        data = yaml.safe_load(file)
+
+    # Путь в dataset.yaml задаётся относительно самого файла
+    root = os.path.join(os.path.dirname(os.path.abspath(data_file)), data['path'])
+    val_dir = os.path.join(root, data['val'])
+    paths = sorted(path for pattern in ('*.jpg', '*.jpeg', '*.png') for path in glob.glob(os.path.join(val_dir, pattern)))
+    if not paths:
+        raise FileNotFoundError(f"В {val_dir} нет изображений")
+    return paths[:limit]
+
+
+def validation_images(data_file, limit):
+    return [cv2.imread(path) for path in validation_paths(data_file, limit)]
+
+
+def load_labels(image_path, width, height):
+    """
+    Разметка YOLO для изображения: .../images/x.jpg -> .../labels/x.txt, строки "cls cx cy w h" в долях кадра.
+    :return: (классы N, рамки N x 4 (x1, y1, x2, y2) в пикселях)
+    """
+    images_dir, name = os.path.split(image_path)
+    label_path = os.path.join(os.path.dirname(images_dir), 'labels', os.path.splitext(name)[0] + '.txt')
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as file:
+            rows = [line.split()[:5] for line in file if line.strip()]
+
+    cls, cx, cy, w, h = np.array(rows, dtype=np.float32).reshape(-1, 5).T
+    boxes = np.column_stack([(cx - w / 2) * width, (cy - h / 2) * height, (cx + w / 2) * width, (cy + h / 2) * height])
+    return cls.astype(np.int64), boxes
+
+
+def match_detections(predictions, gt_classes, gt_boxes):
+    """
+    Сопоставление детекций одного изображения с разметкой: детекции по убыванию уверенности
+    занимают ещё не занятую рамку того же класса с наибольшим IoU.
+    :param predictions: массив N x 6 (x1, y1, x2, y2, conf, cls), как возвращает InferenceBackend.predict()
+    :return: матрица N x len(IOU_THRESHOLDS) — верна ли детекция при каждом пороге IoU
+    """
+    correct = np.zeros((len(predictions), len(IOU_THRESHOLDS)), dtype=bool)
+    if not len(predictions) or not len(gt_boxes):
+        return correct
+
+    order = np.argsort(-predictions[:, 4], kind='stable')
+    iou = iou_matrix(predictions[order, :4], gt_boxes)
+    iou[predictions[order, 5].astype(np.int64)[:, None] != gt_classes[None, :]] = 0
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(gt_boxes), dtype=bool)
+        for i, row in enumerate(iou):
+            candidates = np.where(taken, 0, row)
+            best = candidates.argmax()
+            if candidates[best] >= threshold:
+                taken[best] = True
+                correct[order[i], t] = True
+    return correct
+
+
+def mean_average_precision(correct, confidences, pred_classes, gt_classes):
+    """
+    mAP по всем изображениям: AP каждого класса по 101 точке полноты (как в COCO), среднее по классам разметки.
+    :return: (mAP50, mAP50-95)
+    """
+    order = np.argsort(-confidences, kind='stable')
+    correct, pred_classes = correct[order], pred_classes[order]
+    recall_points = np.linspace(0, 1, 101)
+
+    ap = []
+    for cls in np.unique(gt_classes):
+        tp = correct[pred_classes == cls]
+        if not len(tp):
+            ap.append(np.zeros(len(IOU_THRESHOLDS)))
+            continue
+        tp_sum = np.cumsum(tp, axis=0)
+        recall = tp_sum / (gt_classes == cls).sum()
+        precision = tp_sum / np.arange(1, len(tp) + 1)[:, None]
+        # Огибающая: точность при полноте не меньше заданной
+        precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)
+
+        class_ap = []
+        for t in range(len(IOU_THRESHOLDS)):
+            idx = np.searchsorted(recall[:, t], recall_points, side='left')
+            class_ap.append(np.where(idx < len(tp), precision[np.minimum(idx, len(tp) - 1), t], 0).mean())
+        ap.append(class_ap)
+
+    if not ap:
+        return 0.0, 0.0
+    ap = np.array(ap)
+    return float(ap[:, 0].mean()), float(ap.mean())
+
+
+def measure(backend, frames, batch_size, warmup):
+    for frame in frames[:warmup]:
+        backend.predict([frame])
+
+    # Задержка: по одному кадру
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        backend.predict([frame])
+        latencies.append(time.perf_counter() - start)
+
+    # Пропускная способность: пакетами
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        backend.predict(frames[i:i + batch_size])
+    throughput = len(frames) / (time.perf_counter() - start)
+
+    latencies = np.array(latencies) * 1000
+    return {'p50_ms': np.percentile(latencies, 50), 'p95_ms': np.percentile(latencies, 95), 'fps': throughput}
+
+
+def validation_map(backend, data_file, limit=None, batch_size=8):
+    """
+    mAP по выходу backend.predict() на валидационной выборке — с той же предобработкой, декодированием
+    и подавлением немаксимумов, что и при детекции, и с рабочими порогами бэкенда.
+    """
+    paths = validation_paths(data_file, limit)
+    correct, confidences, pred_classes, gt_classes = [], [], [], []
+    for i in range(0, len(paths), batch_size):
+        frames = [cv2.imread(path) for path in paths[i:i + batch_size]]
+        for path, frame, predictions in zip(paths[i:i + batch_size], frames, backend.predict(frames)):
+            predictions = np.asarray(predictions, dtype=np.float32).reshape(-1, 6)
+            classes, boxes = load_labels(path, frame.shape[1], frame.shape[0])
+            correct.append(match_detections(predictions, classes, boxes))
+            confidences.append(predictions[:, 4])
+            pred_classes.append(predictions[:, 5].astype(np.int64))
+            gt_classes.append(classes)
+
+    return mean_average_precision(np.concatenate(correct), np.concatenate(confidences), np.concatenate(pred_classes),
+                                  np.concatenate(gt_classes))
+
+
+def main():
+    args = parse_args()
+    frames = validation_images(args.data, args.images)
+    print(f"Изображений: {len(frames)}, пакет: {args.batch_size}, потоков ONNX Runtime: {args.threads or os.cpu_count()}")
+
+    rows = []
+    for name in args.backends:
+        backend = create_backend(args.weights, name, threads=args.threads)
+        row = {'backend': name, **measure(backend, frames, args.batch_size, args.warmup)}
+        if not args.no_map:
+            row['map50'], row['map'] = validation_map(backend, args.data, args.map_images, args.batch_size)
+        rows.append(row)
+
+    baseline = next((row for row in rows if row['backend'] == 'eager'), None)
+    header = f"{'backend':<10} {'p50, мс':>9} {'p95, мс':>9} {'кадр/с':>8}"
+    if not args.no_map:
+        header += f" {'mAP50':>7} {'mAP50-95':>9} {'Δ mAP':>8}"
+    print(header)
+    for row in rows:
+        line = f"{row['backend']:<10} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['fps']:>8.1f}"
+        if not args.no_map:
+            drift = row['map'] - baseline['map'] if baseline is not None else float('nan')
+            line += f" {row['map50']:>7.4f} {row['map']:>9.4f} {drift:>+8.4f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
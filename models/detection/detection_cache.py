@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from model_registry import weights_hash
+from postprocess import DETECTION_DTYPE
+
+# Каталог для сохранённых детекций, по умолчанию рядом с этим файлом
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.detection_cache')
+
+
+def video_hash(path):
+    """SHA-256 содержимого видеофайла: одинаковые ролики, загруженные под разными именами, дают один ключ."""
+    return weights_hash(path)
+
+
+class DetectionCache:
+    """
+    Детекции всех кадров видео на диске, по ключу из хэша видео, хэша весов модели и порога уверенности.
+
+    При повторном просмотре того же видео той же моделью детекции читаются из кэша, а кадры только
+    декодируются и размечаются (VideoPipeline.replay), без инференса. Детекции хранятся в .npz одним
+    структурированным массивом с типом DETECTION_DTYPE и смещениями начала каждого кадра.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(video_digest, model_digest, conf_threshold):
+        return f'{video_digest[:32]}-{model_digest[:16]}-{conf_threshold:g}'
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        """
+        :return: список массивов детекций по кадрам или None, если видео ещё не обрабатывалось
+        """
+        if key not in self:
+            return None
+        with np.load(self.path(key)) as data:
+            detections, offsets = data['detections'], data['offsets']
+        return np.split(detections, offsets[1:-1])
+
+    def save(self, key, frames_detections):
+        """
+        :param frames_detections: массивы детекций (DETECTION_DTYPE) всех кадров по порядку
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        counts = [len(detections) for detections in frames_detections]
+        detections = (np.concatenate(frames_detections).astype(DETECTION_DTYPE) if frames_detections
+                      else np.empty(0, dtype=DETECTION_DTYPE))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        # Запись во временный файл и переименование: прерванная запись не оставляет битый кэш
+        tmp_path = self.path(key) + '.tmp.npz'
+        np.savez(tmp_path, detections=detections, offsets=offsets)
+        os.replace(tmp_path, self.path(key))
+
+    def record(self, key, results):
+        """
+        Пропускает через себя FrameResult конвейера и сохраняет детекции, если видео обработано до конца.
+        :param results: генератор VideoPipeline.run(), запущенный с первого кадра
+        """
+        frames_detections = []
+        for result in results:
+            frames_detections.append(result.detections)
+            yield result
+        self.save(key, frames_detections)
@@ -1,42 +1,105 @@
-from ultralytics import YOLO
+import argparse
+import contextlib
+import os
+import sys
+
 import cv2
 
-# Загрузка модели YOLO
-model = YOLO('best.pt')
-
-# Открытие видео
-cap = cv2.VideoCapture(r"C:\Users\very-\Desktop\Projects\Stray-Dog-Detection\models\detection\input_video.mp4")
-fps = int(cap.get(cv2.CAP_PROP_FPS))  # Получение частоты кадров из исходного видео
-width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-output = cv2.VideoWriter("output2.mp4", cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
-
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    # Детекция объектов с помощью YOLO
-    results = model(frame)  # Потоковая обработка
-
-    for r in results:
-        for box, conf, cls in zip(r.boxes.xyxy, r.boxes.conf, r.boxes.cls):
-            x1, y1, x2, y2 = map(int, box[:4])  # Координаты ограничивающей рамки
-            confidence = float(conf)  # Уверенность
-            class_id = int(cls)  # Класс детекции
-
-            if confidence > 0.5:  # Порог уверенности
-                # Рисуем рамку вокруг объекта
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                label = f"Class: {class_id} Conf: {confidence:.2f}"
-                # Выводим метку над рамкой
-                cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-    output.write(frame)
-    cv2.imshow("Object Detection", frame)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
-
-cap.release()
-output.release()
-cv2.destroyAllWindows()
+from backends import BACKENDS, UltralyticsBackend, create_backend
+from model_registry import load_model
+from video_pipeline import VideoPipeline
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Детекция собак на видео")
+    parser.add_argument("--weights", default="best.pt", help="Путь к весам YOLO")
+    parser.add_argument("--input", default=r"C:\Users\very-\Desktop\Projects\Stray-Dog-Detection\models\detection\input_video.mp4",
+                        help="Путь к исходному видео")
+    parser.add_argument("--output", default="output2.mp4", help="Путь к видео с разметкой")
+    parser.add_argument("--export", choices=["torchscript", "onnx"], default=None,
+                        help="Использовать сериализованную версию модели (создаётся один раз и кэшируется на диске)")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Бэкенд инференса")
+    parser.add_argument("--threads", type=int, default=None, help="Число потоков ONNX Runtime")
+    parser.add_argument("--batch-size", type=int, default=8, help="Количество кадров в одном пакете для модели")
+    parser.add_argument("--queue-size", type=int, default=32, help="Размер очереди декодированных кадров")
+    parser.add_argument("--conf", type=float, default=0.5, help="Порог уверенности")
+    parser.add_argument("--no-show", action="store_true", help="Не показывать окно с результатом")
+    parser.add_argument("--db", action="store_true",
+                        help="Сохранять детекции в таблицы video/frame/label (параметры подключения берутся из .env); "
+                             "прерванная обработка того же видео продолжается с последнего сохранённого кадра "
+                             "(видео с разметкой для продолжения пишется в новый файл <output>.from<кадр>), "
+                             "полностью обработанное видео пропускается")
+    parser.add_argument("--commit-every", type=int, default=500, help="Сохранять в базу каждые N кадров")
+    parser.add_argument("--commit-interval", type=float, default=10.0, help="...или каждые T секунд")
+    return parser.parse_args()
+
+
+def open_writer(args, class_names, fps):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'dataset'))
+    from dotenv import load_dotenv
+    from SQLALchemy_utils import PostgresConnection
+    from detection_writer import DetectionWriter
+
+    load_dotenv()
+    conn = PostgresConnection(host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"), user=os.getenv("DB_USER"),
+                              password=os.getenv("DB_PASSWD"))
+    writer = DetectionWriter(conn, args.input, class_names=class_names, fps=fps, commit_every=args.commit_every,
+                             commit_interval=args.commit_interval)
+    if writer.start_frame:
+        print(f"Продолжение обработки с кадра {writer.start_frame}")
+    return writer
+
+
+def main():
+    args = parse_args()
+
+    # Загрузка модели YOLO
+    if args.backend == "eager":
+        model = UltralyticsBackend(load_model(args.weights, export=args.export))
+    else:
+        model = create_backend(args.weights, args.backend, threads=args.threads)
+    pipeline = VideoPipeline(model, batch_size=args.batch_size, queue_size=args.queue_size, conf_threshold=args.conf)
+
+    # Открытие видео
+    cap = cv2.VideoCapture(args.input)
+    fps = int(cap.get(cv2.CAP_PROP_FPS))  # Получение частоты кадров из исходного видео
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    # Имена классов есть только у моделей ultralytics
+    class_names = getattr(getattr(model, 'model', None), 'names', None)
+    writer = open_writer(args, class_names, cap.get(cv2.CAP_PROP_FPS) or None) if args.db else contextlib.nullcontext()
+    start_frame = writer.start_frame if args.db else 0
+
+    if start_frame and 0 < frame_count <= start_frame:
+        print(f"Видео {args.input} уже полностью обработано, пропускаем")
+        writer.close()
+        cap.release()
+        return
+
+    # При продолжении обработки видео с разметкой пишется в отдельный файл, чтобы не затереть уже записанное
+    output_path = args.output
+    if start_frame:
+        stem, ext = os.path.splitext(args.output)
+        output_path = f"{stem}.from{start_frame}{ext}"
+        print(f"Видео с разметкой с кадра {start_frame} записывается в {output_path}")
+    output = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+    try:
+        with writer:
+            for result in pipeline.run(cap, start_frame=start_frame):
+                output.write(result.frame)
+                if args.db:
+                    writer.add(result.index, result.detections)
+                if not args.no_show:
+                    cv2.imshow("Object Detection", result.frame)
+                    if cv2.waitKey(1) & 0xFF == ord("q"):
+                        break
+    finally:
+        output.release()
+        cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
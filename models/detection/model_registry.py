@@ -0,0 +1,143 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+# Каталог для сериализованных моделей (TorchScript/ONNX), по умолчанию рядом с этим файлом
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache')
+
+# Расширения файлов для форматов экспорта ultralytics
+EXPORT_SUFFIXES = {'torchscript': '.torchscript', 'onnx': '.onnx'}
+
+
+def weights_hash(path, chunk_size=1 << 20):
+    """SHA-256 файла весов (читается по частям, файл целиком в память не загружается)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Загрузка моделей детекции с кэшированием.
+
+    Веса загружаются только из локального файла и только один раз на процесс: повторные вызовы load()
+    с теми же параметрами возвращают уже созданную модель. Для моделей ultralytics можно хранить на диске
+    экспортированную TorchScript/ONNX-версию, привязанную к хэшу весов, — при изменении весов она
+    пересоздаётся. Время каждой загрузки (холодной и из кэша) записывается в timings.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.timings = []
+        self._models = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def load(self, weights, kind='ultralytics', device='cpu', export=None, hub_repo=None):
+        """
+        Загрузить модель или вернуть уже загруженную.
+        :param weights: путь к файлу весов (.pt)
+        :param kind: 'ultralytics' — ultralytics.YOLO, 'yolov5' — YOLOv5 через torch.hub
+        :param device: устройство для модели YOLOv5
+        :param export: None, 'torchscript' или 'onnx' — использовать сериализованную версию модели (только ultralytics)
+        :param hub_repo: локальная копия репозитория ultralytics/yolov5 (для работы без сети)
+        """
+        weights = os.path.abspath(weights)
+        if not os.path.isfile(weights):
+            raise FileNotFoundError(f"Файл весов не найден: {weights}")
+        if export is not None and (kind != 'ultralytics' or export not in EXPORT_SUFFIXES):
+            raise ValueError(f"Экспорт '{export}' не поддерживается для моделей типа '{kind}'")
+
+        start = time.perf_counter()
+        with self._lock:
+            digest = self._hash(weights)
+            key = (digest, kind, device, export)
+            cold = key not in self._models
+            if cold:
+                if kind == 'ultralytics':
+                    self._models[key] = self._load_ultralytics(weights, digest, export)
+                elif kind == 'yolov5':
+                    self._models[key] = self._load_yolov5(weights, device, hub_repo)
+                else:
+                    raise ValueError(f"Неизвестный тип модели: {kind}")
+            model = self._models[key]
+
+        elapsed = time.perf_counter() - start
+        self.timings.append({'weights': weights, 'kind': kind, 'export': export, 'cold': cold, 'seconds': elapsed})
+        print(f"Модель {os.path.basename(weights)} загружена за {elapsed:.2f} с "
+              f"({'холодный старт' if cold else 'из кэша'})")
+        return model
+
+    def digest(self, weights):
+        """Хэш файла весов (используется как часть ключей кэшей, зависящих от модели)."""
+        return self._hash(os.path.abspath(weights))
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._hashes.clear()
+
+    def _hash(self, weights):
+        # Хэш пересчитывается, только если файл весов изменился
+        stat = os.stat(weights)
+        signature = (weights, stat.st_size, stat.st_mtime_ns)
+        if signature not in self._hashes:
+            self._hashes[signature] = weights_hash(weights)
+        return self._hashes[signature]
+
+    def _load_ultralytics(self, weights, digest, export):
+        from ultralytics import YOLO
+
+        if export is None:
+            return YOLO(weights)
+
+        return YOLO(self.export_artifact(weights, export, digest), task='detect')
+
+    def export_artifact(self, weights, export, digest=None):
+        """
+        Путь к сериализованной версии модели ultralytics; при первом обращении модель экспортируется.
+        :param export: 'torchscript' или 'onnx'
+        """
+        from ultralytics import YOLO
+
+        artifact = self.artifact_path(weights, export, digest=digest)
+        if not os.path.exists(artifact):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Динамическая размерность пакета нужна, чтобы конвейер мог подавать несколько кадров сразу
+            exported = YOLO(weights).export(format=export, dynamic=export == 'onnx')
+            shutil.move(exported, artifact)
+        return artifact
+
+    def artifact_path(self, weights, export, tag='', digest=None):
+        """Путь к файлу сериализованной модели в кэше: имя весов, начало хэша весов, тег и расширение формата."""
+        weights = os.path.abspath(weights)
+        digest = digest or self._hash(weights)
+        stem = os.path.splitext(os.path.basename(weights))[0]
+        return os.path.join(self.cache_dir, f'{stem}-{digest[:16]}{tag}{EXPORT_SUFFIXES[export]}')
+
+    @staticmethod
+    def _load_yolov5(weights, device, hub_repo):
+        import torch
+
+        # Без сети используем локальную копию репозитория: явно заданную или оставшуюся в кэше torch.hub
+        hub_repo = hub_repo or os.getenv('YOLOV5_REPO')
+        if hub_repo is None:
+            cached_repo = os.path.join(torch.hub.get_dir(), 'ultralytics_yolov5_master')
+            if os.path.isdir(cached_repo):
+                hub_repo = cached_repo
+
+        if hub_repo is not None:
+            return torch.hub.load(hub_repo, 'custom', path=weights, source='local', device=device)
+        return torch.hub.load('ultralytics/yolov5', 'custom', path=weights, device=device, trust_repo=True)
+
+
+# Общий реестр процесса
+registry = ModelRegistry()
+
+
+def load_model(weights, kind='ultralytics', device='cpu', export=None, hub_repo=None):
+    return registry.load(weights, kind=kind, device=device, export=export, hub_repo=hub_repo)
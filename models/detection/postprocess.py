@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+
+# Компактное представление детекций одного кадра: одна запись на объект
+DETECTION_DTYPE = np.dtype([
+    ('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+    ('conf', np.float32), ('cls', np.int32),
+])
+
+# Формат подписи по умолчанию (как в dog_detection.py и streamlit/st.py)
+DEFAULT_LABEL_FORMAT = "Class: {cls} Conf: {conf:.2f}"
+
+
+def _to_numpy(data):
+    # Тензоры torch переносим на CPU, numpy-массивы оставляем как есть
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    return np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+
+def to_detections(data, conf_threshold=0.0):
+    """
+    Фильтрация по порогу уверенности и перевод координат в целые числа одной операцией на кадр.
+    :param data: массив или тензор N x 6 со столбцами (x1, y1, x2, y2, conf, cls)
+    :param conf_threshold: порог уверенности, остаются детекции со строго большей уверенностью
+    :return: структурированный массив с типом DETECTION_DTYPE
+    """
+    data = _to_numpy(data)
+    data = data[data[:, 4] > conf_threshold]
+
+    detections = np.empty(len(data), dtype=DETECTION_DTYPE)
+    coords = data[:, :4].astype(np.int32)
+    detections['x1'], detections['y1'], detections['x2'], detections['y2'] = coords.T
+    detections['conf'] = data[:, 4]
+    detections['cls'] = data[:, 5].astype(np.int32)
+    return detections
+
+
+def class_names_of(detections, class_names):
+    """
+    Названия классов для всех детекций кадра.
+    Номера классов вне списка class_names получают название "Unknown".
+    :param detections: структурированный массив детекций или просто массив номеров классов
+    """
+    names = np.asarray(list(class_names) + ["Unknown"], dtype=object)
+    detections = np.asarray(detections)
+    cls = detections['cls'] if detections.dtype.names else detections.astype(np.int64)
+    cls = np.where((cls >= 0) & (cls < len(class_names)), cls, len(class_names))
+    return names[cls]
+
+
+def make_labels(detections, label_format=DEFAULT_LABEL_FORMAT, class_names=None):
+    """
+    Подписи для рамок.
+    :param label_format: шаблон подписи, доступны поля cls, conf и name (если передан class_names)
+    """
+    names = class_names_of(detections, class_names) if class_names is not None else [None] * len(detections)
+    return [label_format.format(cls=cls, conf=conf, name=name)
+            for cls, conf, name in zip(detections['cls'].tolist(), detections['conf'].tolist(), names)]
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Попарный IoU двух наборов рамок.
+    :param boxes_a: массив N x 4 (x1, y1, x2, y2)
+    :param boxes_b: массив M x 4 (x1, y1, x2, y2)
+    :return: матрица N x M
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+def nms(boxes, scores, classes=None, iou_threshold=0.45, max_det=300):
+    """
+    Подавление немаксимумов.
+    :param boxes: массив N x 4 (x1, y1, x2, y2)
+    :param scores: уверенности N
+    :param classes: номера классов N; если переданы, рамки разных классов друг друга не подавляют
+    :return: индексы оставленных рамок по убыванию уверенности
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if classes is not None:
+        # Сдвигаем рамки разных классов так, чтобы они не пересекались
+        boxes = boxes + np.asarray(classes, dtype=np.float32)[:, None] * (boxes.max(initial=0) + 1)
+
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    keep = []
+    while order.size and len(keep) < max_det:
+        best = order[0]
+        keep.append(best)
+        order = order[1:][iou_matrix(boxes[best], boxes[order[1:]])[0] <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def crop_detections(frame, detections):
+    """Вырезанные области кадра для каждой детекции (без копирования)."""
+    return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in _boxes(detections, frame.shape)]
+
+
+def draw_detections(frame, detections, labels=None, color=(0, 255, 0), thickness=2):
+    """
+    Отрисовка рамок и подписей на кадре (кадр изменяется на месте).
+    :param labels: список подписей той же длины, что и detections; None — только рамки
+    """
+    boxes = detections[['x1', 'y1', 'x2', 'y2']].tolist()
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        # Рисуем рамку вокруг объекта
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
+        if labels is not None:
+            # Выводим метку над рамкой
+            cv2.putText(frame, labels[i], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, thickness)
+
+    return frame
+
+
+def _boxes(detections, shape):
+    # Координаты, обрезанные по границам кадра, чтобы срезы не были пустыми из-за отрицательных значений
+    height, width = shape[:2]
+    xs = np.clip(detections[['x1', 'x2']].tolist(), 0, width).reshape(-1, 2)
+    ys = np.clip(detections[['y1', 'y2']].tolist(), 0, height).reshape(-1, 2)
+    return np.column_stack([xs[:, 0], ys[:, 0], xs[:, 1], ys[:, 1]]).tolist()
@@ -0,0 +1,60 @@
+import os
+
+import cv2
+import numpy as np
+
+from backends import InferenceBackend
+from benchmark_backends import match_detections, mean_average_precision, validation_map
+
+
+class LabelBackend(InferenceBackend):
+    """Возвращает заданные детекции для каждого кадра по порядку."""
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+
+    def predict(self, frames):
+        return [self.outputs.pop(0) for _ in frames]
+
+
+def make_dataset(tmp_path, labels):
+    images_dir, labels_dir = tmp_path / 'valid' / 'images', tmp_path / 'valid' / 'labels'
+    os.makedirs(images_dir)
+    os.makedirs(labels_dir)
+    for i, rows in enumerate(labels):
+        cv2.imwrite(str(images_dir / f'{i}.jpg'), np.zeros((100, 200, 3), np.uint8))
+        (labels_dir / f'{i}.txt').write_text(''.join(f'{cls} {cx} {cy} {w} {h}\n' for cls, cx, cy, w, h in rows))
+    data_file = tmp_path / 'dataset.yaml'
+    data_file.write_text('path: .\nval: valid/images\n')
+    return str(data_file)
+
+
+def test_perfect_predictions_give_full_map(tmp_path):
+    # Рамки в долях кадра 200 x 100
+    data_file = make_dataset(tmp_path, [[(0, 0.25, 0.5, 0.2, 0.4)], [(1, 0.5, 0.5, 0.5, 0.5), (0, 0.1, 0.1, 0.1, 0.1)]])
+    backend = LabelBackend([
+        np.array([[30, 30, 70, 70, 0.9, 0]], np.float32),
+        np.array([[50, 25, 150, 75, 0.8, 1], [10, 5, 30, 15, 0.7, 0]], np.float32),
+    ])
+    assert validation_map(backend, data_file, batch_size=2) == (1.0, 1.0)
+
+
+def test_wrong_class_and_shifted_boxes_lower_map(tmp_path):
+    data_file = make_dataset(tmp_path, [[(0, 0.25, 0.5, 0.2, 0.4)], [(1, 0.5, 0.5, 0.5, 0.5)]])
+    backend = LabelBackend([
+        np.array([[30, 30, 70, 70, 0.9, 1]], np.float32),  # неверный класс
+        np.array([[60, 25, 160, 75, 0.8, 1]], np.float32),  # IoU = 0.67
+    ])
+    map50, map50_95 = validation_map(backend, data_file, batch_size=1)
+    # Класс 0 не найден (AP 0), у класса 1 первая по уверенности детекция ложная (AP 0.5)
+    assert map50 == 0.25
+    assert 0 < map50_95 < map50
+
+
+def test_duplicate_detection_is_false_positive():
+    predictions = np.array([[0, 0, 10, 10, 0.9, 0], [0, 0, 10, 10, 0.8, 0]], np.float32)
+    correct = match_detections(predictions, np.array([0]), np.array([[0, 0, 10, 10]], np.float32))
+    assert correct[:, 0].tolist() == [True, False]
+
+    map50, _ = mean_average_precision(correct, predictions[:, 4], np.array([0, 0]), np.array([0]))
+    assert map50 == 1.0
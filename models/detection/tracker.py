@@ -0,0 +1,183 @@
+import time
+
+import numpy as np
+
+from postprocess import iou_matrix
+
+
+class _KalmanBox:
+    """
+    Фильтр Калмана с моделью постоянной скорости, как в SORT.
+    Состояние: центр (cx, cy), площадь s, соотношение сторон r и скорости cx, cy, s.
+    """
+
+    # Матрица перехода и матрица наблюдения
+    F = np.eye(7, dtype=np.float64)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1.0
+    H = np.eye(4, 7, dtype=np.float64)
+
+    def __init__(self, box):
+        self.x = np.zeros(7)
+        self.x[:4] = self._to_z(box)
+
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+        self.Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 1e-4])
+        self.R = np.diag([1.0, 1.0, 10.0, 10.0])
+
+    def predict(self):
+        # Площадь не может стать отрицательной
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0.0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return self.box()
+
+    def update(self, box):
+        y = self._to_z(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+
+    def box(self):
+        cx, cy, s, r = self.x[:4]
+        w = np.sqrt(max(s * r, 0.0))
+        h = s / w if w > 0 else 0.0
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    @staticmethod
+    def _to_z(box):
+        x1, y1, x2, y2 = box
+        w, h = x2 - x1, y2 - y1
+        return np.array([x1 + w / 2, y1 + h / 2, w * h, w / max(h, 1e-6)])
+
+
+class Track:
+    """Одна собака, которую трекер видит на нескольких кадрах подряд."""
+
+    def __init__(self, track_id, detection, frame_index):
+        self.track_id = track_id
+        self.first_frame = self.last_frame = frame_index
+        self.first_seen = self.last_seen = time.time()
+        self.hits = 0
+        self.misses = 0
+
+        # Лучшая детекция трека: рамка, уверенность, класс и вырезанное изображение
+        self.best_score = -1.0
+        self.best_box = None
+        self.best_conf = 0.0
+        self.best_cls = -1
+        self.best_crop = None
+        self.best_frame = frame_index
+
+        self._kalman = _KalmanBox(self._box_of(detection))
+
+    def predict(self):
+        return self._kalman.predict()
+
+    def update(self, detection, frame_index, frame=None):
+        box = self._box_of(detection)
+        self._kalman.update(box)
+        self.hits += 1
+        self.misses = 0
+        self.last_frame = frame_index
+        self.last_seen = time.time()
+
+        # Качество детекции: уверенность модели с поправкой на размер рамки
+        x1, y1, x2, y2 = box
+        score = float(detection['conf']) * np.sqrt(max((x2 - x1) * (y2 - y1), 0))
+        if score > self.best_score:
+            self.best_score = score
+            self.best_box = [int(v) for v in box]
+            self.best_conf = float(detection['conf'])
+            self.best_cls = int(detection['cls'])
+            self.best_frame = frame_index
+            if frame is not None:
+                height, width = frame.shape[:2]
+                x1, x2 = np.clip([x1, x2], 0, width).astype(int)
+                y1, y2 = np.clip([y1, y2], 0, height).astype(int)
+                self.best_crop = frame[y1:y2, x1:x2].copy()
+
+    @staticmethod
+    def _box_of(detection):
+        return np.array([detection['x1'], detection['y1'], detection['x2'], detection['y2']], dtype=np.float64)
+
+
+class Tracker:
+    """
+    Простой многообъектный трекер в духе SORT: предсказание фильтром Калмана и сопоставление по IoU.
+
+    update() вызывается на каждом кадре, где запускалась модель, и возвращает номера треков для детекций
+    кадра и список завершённых треков. Трек завершается, когда его не видно max_age обработанных кадров
+    подряд; треки короче min_hits кадров считаются ложными срабатываниями и не возвращаются.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=30, min_hits=3):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+
+        self.tracks = []
+        self.frame_index = 0
+        self._next_id = 1
+
+    def update(self, detections, frame=None):
+        """
+        :param detections: структурированный массив детекций кадра (postprocess.DETECTION_DTYPE)
+        :param frame: исходный кадр без разметки, из него вырезаются лучшие изображения треков
+        :return: (номера треков для каждой детекции, список завершённых треков)
+        """
+        self.frame_index += 1
+
+        predicted = np.array([track.predict() for track in self.tracks]).reshape(-1, 4)
+        boxes = np.column_stack([detections['x1'], detections['y1'], detections['x2'], detections['y2']])
+        matches = self._match(boxes, predicted)
+
+        track_ids = np.full(len(detections), -1, dtype=np.int64)
+        matched_tracks = set()
+        for det_idx, track_idx in matches:
+            track = self.tracks[track_idx]
+            track.update(detections[det_idx], self.frame_index, frame)
+            track_ids[det_idx] = track.track_id
+            matched_tracks.add(track_idx)
+
+        for track_idx, track in enumerate(self.tracks):
+            if track_idx not in matched_tracks:
+                track.misses += 1
+
+        # Новые треки для детекций без пары
+        for det_idx in np.flatnonzero(track_ids == -1):
+            track = Track(self._next_id, detections[det_idx], self.frame_index)
+            track.update(detections[det_idx], self.frame_index, frame)
+            self._next_id += 1
+            self.tracks.append(track)
+            track_ids[det_idx] = track.track_id
+
+        finished = [track for track in self.tracks if track.misses > self.max_age]
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_age]
+        return track_ids, [track for track in finished if track.hits >= self.min_hits]
+
+    def flush(self):
+        """Завершить все активные треки (например, при остановке камеры)."""
+        finished = [track for track in self.tracks if track.hits >= self.min_hits]
+        self.tracks = []
+        return finished
+
+    def _match(self, boxes, predicted):
+        if len(boxes) == 0 or len(predicted) == 0:
+            return []
+
+        iou = iou_matrix(boxes, predicted)
+        # Жадное сопоставление: пары с наибольшим IoU забираются первыми
+        det_candidates, track_candidates = np.nonzero(iou >= self.iou_threshold)
+        order = np.argsort(-iou[det_candidates, track_candidates], kind='stable')
+
+        matches = []
+        used_dets, used_tracks = set(), set()
+        for det_idx, track_idx in zip(det_candidates[order].tolist(), track_candidates[order].tolist()):
+            if det_idx in used_dets or track_idx in used_tracks:
+                continue
+            used_dets.add(det_idx)
+            used_tracks.add(track_idx)
+            matches.append((det_idx, track_idx))
+        return matches
@@ -0,0 +1,209 @@
+import csv
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from postprocess import DETECTION_DTYPE
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class VideoJob:
+    """
+    Состояние фоновой обработки одного видео. Поля обновляет поток обработки, читает интерфейс.
+    """
+
+    def __init__(self, job_id, video_path, work_dir):
+        self.id = job_id
+        self.video_path = video_path
+        self.work_dir = work_dir
+        self.output_path = os.path.join(work_dir, 'annotated.mp4')
+        self.detections_path = os.path.join(work_dir, 'detections.csv')
+
+        self.status = QUEUED
+        self.error = None
+        self.frames_done = 0
+        self.frames_total = 0
+        self.started_at = None
+        self.finished_at = None
+        self.preview = None
+        self.preview_index = -1
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def fps(self):
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return self.frames_done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Оставшееся время в секундах или None, если его пока нельзя оценить."""
+        fps = self.fps
+        if not fps or not self.frames_total:
+            return None
+        return max(0, self.frames_total - self.frames_done) / fps
+
+    @property
+    def progress(self):
+        return min(1.0, self.frames_done / self.frames_total) if self.frames_total else 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class VideoJobManager:
+    """
+    Очередь обработки видео в фоновых потоках.
+
+    Обработка не зависит от того, открыта ли страница: интерфейс только опрашивает состояние задачи.
+    Каждый кадр с разметкой пишется в итоговое видео, а для предпросмотра сохраняется уменьшенная копия кадра
+    не чаще preview_fps раз в секунду. Детекции всех кадров сохраняются в csv для скачивания.
+    """
+
+    def __init__(self, process, max_workers=1, preview_fps=4.0, preview_width=640, max_finished=20):
+        """
+        :param process: функция process(video_path) -> итератор FrameResult (например, VideoPipeline.run)
+        :param max_workers: количество видео, обрабатываемых одновременно, остальные ждут в очереди
+        :param preview_fps: максимальная частота обновления кадра предпросмотра
+        :param preview_width: максимальная ширина кадра предпросмотра
+        :param max_finished: сколько завершённых задач хранить (файлы более старых удаляются)
+        """
+        self.process = process
+        self.preview_fps = preview_fps
+        self.preview_width = preview_width
+        self.max_finished = max_finished
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='video-job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, video_file, suffix='.mp4'):
+        """
+        Поставить видео в очередь. Видео копируется в рабочий каталог задачи.
+        :param video_file: путь к видео или файловый объект (например, загруженный в streamlit файл)
+        :return: VideoJob
+        """
+        work_dir = tempfile.mkdtemp(prefix='video-job-')
+        video_path = os.path.join(work_dir, 'source' + suffix)
+        if isinstance(video_file, (str, os.PathLike)):
+            shutil.copyfile(video_file, video_path)
+        else:
+            with open(video_path, 'wb') as file:
+                shutil.copyfileobj(video_file, file)
+
+        with self._lock:
+            job = VideoJob(next(self._ids), video_path, work_dir)
+            self._jobs[job.id] = job
+            self._cleanup()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job):
+        """Количество задач в очереди перед этой задачей."""
+        with self._lock:
+            return sum(1 for other in self._jobs.values() if other.status == QUEUED and other.id < job.id)
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _cleanup(self):
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.id)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            del self._jobs[job.id]
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            return
+
+        cap = cv2.VideoCapture(job.video_path)
+        job.frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps > 0 else 25.0
+        cap.release()
+
+        job.status = RUNNING
+        job.started_at = time.perf_counter()
+        # Итоговый статус публикуется только после закрытия файлов: DONE означает, что mp4 уже дописан
+        status = RUNNING
+        writer = None
+        last_preview = 0.0
+        try:
+            with open(job.detections_path, 'w', newline='') as file:
+                csv_writer = csv.writer(file)
+                csv_writer.writerow(['frame', *DETECTION_DTYPE.names])
+
+                results = self.process(job.video_path)
+                try:
+                    for result in results:
+                        if job.cancel_event.is_set():
+                            status = CANCELLED
+                            break
+
+                        if writer is None:
+                            height, width = result.frame.shape[:2]
+                            writer = cv2.VideoWriter(job.output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps,
+                                                     (width, height))
+                            if not writer.isOpened():
+                                raise RuntimeError(f"Не удалось открыть {job.output_path} для записи")
+                        writer.write(result.frame)
+                        csv_writer.writerows([result.index, *detection.tolist()] for detection in result.detections)
+                        job.frames_done += 1
+
+                        # Кадр предпросмотра уменьшается и обновляется не чаще preview_fps раз в секунду
+                        now = time.perf_counter()
+                        if now - last_preview >= 1 / self.preview_fps:
+                            job.preview = self._downscale(result.frame)
+                            job.preview_index = result.index
+                            last_preview = now
+                finally:
+                    # Останавливаем конвейер, если обработка прервана
+                    if hasattr(results, 'close'):
+                        results.close()
+
+            if status == RUNNING:
+                if job.frames_done == 0:
+                    raise RuntimeError("В видео не найдено ни одного кадра")
+                job.frames_total = job.frames_done
+                status = DONE
+        except Exception as error:
+            job.error = error
+            status = FAILED
+        finally:
+            try:
+                if writer is not None:
+                    writer.release()
+            finally:
+                job.finished_at = time.perf_counter()
+                # Исходное видео больше не нужно, остаются результат и детекции
+                if os.path.exists(job.video_path):
+                    os.remove(job.video_path)
+                job.status = status if status != RUNNING else FAILED
+
+    def _downscale(self, frame):
+        height, width = frame.shape[:2]
+        if width <= self.preview_width:
+            return frame.copy()
+        scale = self.preview_width / width
+        return cv2.resize(frame, (self.preview_width, int(height * scale)), interpolation=cv2.INTER_AREA)
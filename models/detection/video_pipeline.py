@@ -0,0 +1,191 @@
+import queue
+import threading
+from collections import namedtuple
+
+import cv2
+
+from backends import InferenceBackend, UltralyticsBackend
+from postprocess import draw_detections, make_labels, to_detections
+
+# Результат обработки одного кадра: номер кадра, кадр с разметкой и массив детекций (postprocess.DETECTION_DTYPE)
+FrameResult = namedtuple('FrameResult', ['index', 'frame', 'detections'])
+
+# Маркер конца потока между стадиями конвейера
+_END = object()
+
+
+class _StageError:
+    """Обёртка для исключения, возникшего в фоновой стадии конвейера."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class VideoPipeline:
+    """
+    Конвейерная обработка видео: декодирование, детекция и отрисовка выполняются параллельно.
+
+    Декодирование кадров идёт в отдельном потоке и складывает кадры в ограниченную очередь,
+    детекция выполняется в своём потоке пакетами по batch_size кадров, а отрисовка
+    выполняется в вызывающем потоке при итерации по run().
+    """
+
+    def __init__(self, model, batch_size=8, queue_size=32, conf_threshold=0.5):
+        """
+        :param model: бэкенд инференса (backends.InferenceBackend) или модель ultralytics.YOLO
+        """
+        self.backend = model if isinstance(model, InferenceBackend) else UltralyticsBackend(model)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.conf_threshold = conf_threshold
+
+    def run(self, source, start_frame=0):
+        """
+        Обработка видео из файла или потока.
+        :param source: путь к видео, URL потока или индекс камеры (либо уже открытый cv2.VideoCapture)
+        :param start_frame: номер кадра, с которого начинать обработку
+        :return: генератор FrameResult в порядке следования кадров
+        """
+        cap = source if isinstance(source, cv2.VideoCapture) else cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise IOError(f"Не удалось открыть видео: {source}")
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        frames_queue = queue.Queue(maxsize=self.queue_size)
+        results_queue = queue.Queue(maxsize=max(1, self.queue_size // self.batch_size))
+        stop_event = threading.Event()
+
+        reader = threading.Thread(target=self._read_frames, args=(cap, start_frame, frames_queue, stop_event),
+                                  daemon=True)
+        detector = threading.Thread(target=self._detect_batches, args=(frames_queue, results_queue, stop_event),
+                                    daemon=True)
+        reader.start()
+        detector.start()
+
+        try:
+            while True:
+                item = results_queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, _StageError):
+                    raise item.error
+
+                for index, frame, detections in item:
+                    yield FrameResult(index, self.draw_detections(frame, detections), detections)
+        finally:
+            # Останавливаем фоновые стадии, даже если потребитель прервал итерацию раньше времени
+            stop_event.set()
+            self._drain(results_queue)
+            self._drain(frames_queue)
+            detector.join()
+            reader.join()
+            cap.release()
+
+    def replay(self, source, frames_detections, start_frame=0):
+        """
+        Разметка видео по уже известным детекциям (например, из detection_cache.DetectionCache), без инференса.
+        :param frames_detections: массивы детекций по кадрам, начиная с кадра 0
+        :return: генератор FrameResult в порядке следования кадров
+        """
+        cap = source if isinstance(source, cv2.VideoCapture) else cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise IOError(f"Не удалось открыть видео: {source}")
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        try:
+            for index in range(start_frame, len(frames_detections)):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                detections = frames_detections[index]
+                yield FrameResult(index, self.draw_detections(frame, detections), detections)
+        finally:
+            cap.release()
+
+    def _read_frames(self, cap, start_frame, frames_queue, stop_event):
+        index = start_frame
+        try:
+            while not stop_event.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if not self._put(frames_queue, (index, frame), stop_event):
+                    return
+                index += 1
+        except Exception as error:
+            self._put(frames_queue, _StageError(error), stop_event)
+            return
+        self._put(frames_queue, _END, stop_event)
+
+    def _detect_batches(self, frames_queue, results_queue, stop_event):
+        try:
+            while not stop_event.is_set():
+                # Первый кадр пакета ждём, остальные добираем из того, что уже декодировано
+                item = self._get(frames_queue, stop_event)
+                if item is None:
+                    return
+                batch = [item]
+                while len(batch) < self.batch_size and not self._is_marker(batch[-1]):
+                    try:
+                        batch.append(frames_queue.get(timeout=0.01))
+                    except queue.Empty:
+                        break
+
+                marker = batch.pop() if self._is_marker(batch[-1]) else None
+                if batch:
+                    indices, frames = zip(*batch)
+                    detections = self.detect(list(frames))
+                    if not self._put(results_queue, list(zip(indices, frames, detections)), stop_event):
+                        return
+
+                if marker is not None:
+                    self._put(results_queue, marker, stop_event)
+                    return
+        except Exception as error:
+            self._put(results_queue, _StageError(error), stop_event)
+
+    def detect(self, frames):
+        """
+        Детекция объектов на пакете кадров.
+        :param frames: список кадров в формате BGR
+        :return: список структурированных массивов детекций (postprocess.DETECTION_DTYPE) для каждого кадра
+        """
+        return [to_detections(data, self.conf_threshold) for data in self.backend.predict(frames)]
+
+    @staticmethod
+    def draw_detections(frame, detections):
+        return draw_detections(frame, detections, make_labels(detections))
+
+    @staticmethod
+    def _is_marker(item):
+        return item is _END or isinstance(item, _StageError)
+
+    @staticmethod
+    def _put(target_queue, item, stop_event):
+        # Ограниченная очередь создаёт обратное давление, но не должна блокировать остановку конвейера
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _get(source_queue, stop_event):
+        while not stop_event.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    @staticmethod
+    def _drain(target_queue):
+        while True:
+            try:
+                target_queue.get_nowait()
+            except queue.Empty:
+                return
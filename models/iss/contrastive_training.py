@@ -0,0 +1,60 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from triplet_training import PKBatchSampler, group_by_class
+
+
+def make_pair_dataloader(dataset, p=8, k=4, batches_per_epoch=None, num_workers=4, seed=None):
+    """
+    DataLoader для DogDataset: пакеты из P собак по K фото, чтобы среди всех пар пакета были и похожие, и непохожие.
+    """
+    sampler = PKBatchSampler(group_by_class(zip(dataset.image_paths, dataset.labels)), p=p, k=k,
+                             batches_per_epoch=batches_per_epoch, seed=seed)
+    return DataLoader(dataset, batch_sampler=sampler, num_workers=num_workers,
+                      pin_memory=torch.cuda.is_available(), persistent_workers=num_workers > 0)
+
+
+def all_pairs_cosine_loss(embeddings, labels, margin=0.0, threshold=0.5, balanced=True):
+    """
+    CosineEmbeddingLoss по всем парам пакета сразу: матрица косинусных сходств и маска совпадения меток.
+    Для похожих пар потеря 1 - cos, для непохожих max(0, cos - margin).
+    :param threshold: порог сходства, выше которого пара считается одной собакой (для точности)
+    :param balanced: усреднять потери похожих и непохожих пар отдельно (непохожих пар в пакете намного больше)
+    :return: (loss, точность в процентах по всем парам)
+    """
+    normalized = F.normalize(embeddings, dim=1)
+    similarity = normalized @ normalized.T
+
+    same = labels.unsqueeze(0) == labels.unsqueeze(1)
+    # Каждая пара учитывается один раз, пары изображения с самим собой не учитываются
+    upper = torch.triu(torch.ones(same.shape, device=same.device), diagonal=1).bool()
+    positive = same & upper
+    negative = ~same & upper
+
+    positive_losses = 1 - similarity[positive]
+    negative_losses = (similarity[negative] - margin).clamp(min=0)
+    if balanced:
+        parts = [losses.mean() for losses in (positive_losses, negative_losses) if losses.numel()]
+    else:
+        losses = torch.cat([positive_losses, negative_losses])
+        parts = [losses.mean()] if losses.numel() else []
+    loss = torch.stack(parts).mean() if parts else embeddings.sum() * 0
+
+    with torch.no_grad():
+        pred = similarity > threshold
+        correct = (pred == same)[upper].float()
+        accuracy = correct.mean().item() * 100 if correct.numel() else 0.0
+    return loss, accuracy
+
+
+class AllPairsCosineLoss(nn.Module):
+    def __init__(self, margin=0.0, threshold=0.5, balanced=True):
+        super().__init__()
+        self.margin = margin
+        self.threshold = threshold
+        self.balanced = balanced
+
+    def forward(self, embeddings, labels):
+        return all_pairs_cosine_loss(embeddings, labels, self.margin, self.threshold, self.balanced)
@@ -0,0 +1,100 @@
+import os
+import time
+
+import torch
+
+
+class AverageMeters(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.avg = 0
+        self.cnt = 0
+        self.sum = 0
+        self.val = 0
+
+    def update(self, val, n=1):
+        self.val = val
+        self.sum += val * n
+        self.cnt += n
+        self.avg = self.sum / self.cnt
+
+
+def save_checkpoint(save_path, state, epoch, tag=''):
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+    filename = os.path.join(save_path, "{}checkpoint-{:06}.pth.tar".format(tag, epoch))
+    torch.save(state, filename)
+
+
+def labels_to_tensor(labels, device):
+    """Метки пакета в тензор; строковые метки (имена собак из DogDataset) нумеруются внутри пакета."""
+    if isinstance(labels, torch.Tensor):
+        return labels.to(device, non_blocking=True)
+    ids = {}
+    return torch.tensor([ids.setdefault(label, len(ids)) for label in labels], device=device)
+
+
+def train_loop(dataloader, model, criterion, optimizer, device, log_every=None):
+    """
+    Эпоха обучения с одним проходом сети на пакет.
+    :param criterion: функция потерь criterion(embeddings, labels) -> (loss, accuracy)
+    :param log_every: печатать прогресс каждые log_every пакетов
+    """
+    losses = AverageMeters()
+    accs = AverageMeters()
+    start, samples = time.perf_counter(), 0
+
+    # switch to train mode
+    model.train()
+
+    for step, (images, labels) in enumerate(dataloader, 1):
+        images = images.to(device, non_blocking=True)
+        labels = labels_to_tensor(labels, device)
+
+        # compute output
+        embeddings = model(images).view(images.size(0), -1)
+        loss, acc = criterion(embeddings, labels)
+
+        # record loss and accurasy
+        losses.update(loss.item(), images.size(0))
+        accs.update(acc, images.size(0))
+
+        # compute gradient and do Adam step
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        samples += images.size(0)
+        if log_every and step % log_every == 0:
+            print(f"[{step}/{len(dataloader)}] loss: {losses.avg:.4f}\t acc: {accs.avg:.2f}\t "
+                  f"{samples / (time.perf_counter() - start):.1f} изобр./с")
+
+    print(f"Обучение: {samples / (time.perf_counter() - start):.1f} изобр./с")
+    return accs.avg, losses.avg
+
+
+def test_loop(dataloader, model, criterion, device):
+    losses = AverageMeters()
+    accs = AverageMeters()
+    start, samples = time.perf_counter(), 0
+
+    # switch to val mode
+    model.eval()
+
+    with torch.no_grad():
+        for images, labels in dataloader:
+            images = images.to(device, non_blocking=True)
+            labels = labels_to_tensor(labels, device)
+
+            embeddings = model(images).view(images.size(0), -1)
+            loss, acc = criterion(embeddings, labels)
+
+            # record loss and accurasy
+            losses.update(loss.item(), images.size(0))
+            accs.update(acc, images.size(0))
+            samples += images.size(0)
+
+    print(f"Валидация: {samples / (time.perf_counter() - start):.1f} изобр./с")
+    return accs.avg, losses.avg
@@ -0,0 +1,128 @@
+import random
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Sampler
+
+
+def group_by_class(samples):
+    """
+    Создает словарь, где ключ — класс, а значение — индексы изображений этого класса.
+    :param samples: список пар (путь, класс), например ImageFolder.samples
+    """
+    class_to_indices = {}
+    for idx, (_, label) in enumerate(samples):
+        class_to_indices.setdefault(label, []).append(idx)
+    return class_to_indices
+
+
+class PKBatchSampler(Sampler):
+    """
+    Пакеты из P классов по K изображений: в каждом пакете есть и позитивы, и негативы для каждого якоря,
+    поэтому тройки выбираются внутри пакета и каждое изображение декодируется и проходит через сеть один раз.
+    """
+
+    def __init__(self, class_to_indices, p=8, k=4, batches_per_epoch=None, seed=None):
+        """
+        :param class_to_indices: словарь класс -> индексы изображений (см. group_by_class)
+        :param p: количество классов в пакете
+        :param k: количество изображений каждого класса; если изображений меньше, они повторяются
+        :param batches_per_epoch: по умолчанию — сколько пакетов помещается в датасет
+        """
+        # Для троек нужен хотя бы один позитив, классы с одним изображением не подходят в качестве якорей
+        self.class_to_indices = {label: indices for label, indices in class_to_indices.items() if len(indices) > 1}
+        if len(self.class_to_indices) < 2:
+            raise ValueError("Нужно хотя бы два класса, в которых больше одного изображения")
+
+        self.p = min(p, len(self.class_to_indices))
+        self.k = k
+        total = sum(len(indices) for indices in self.class_to_indices.values())
+        self.batches_per_epoch = batches_per_epoch or max(1, total // (self.p * self.k))
+        self.random = random.Random(seed)
+
+    def __len__(self):
+        return self.batches_per_epoch
+
+    def __iter__(self):
+        labels = list(self.class_to_indices)
+        for _ in range(self.batches_per_epoch):
+            batch = []
+            for label in self.random.sample(labels, self.p):
+                indices = self.class_to_indices[label]
+                if len(indices) >= self.k:
+                    batch.extend(self.random.sample(indices, self.k))
+                else:
+                    batch.extend(self.random.choices(indices, k=self.k))
+            yield batch
+
+
+def make_pk_dataloader(image_folder, transform=None, p=8, k=4, batches_per_epoch=None, num_workers=4, seed=None):
+    """
+    DataLoader с PKBatchSampler для torchvision.datasets.ImageFolder.
+    :param transform: преобразования для изображений (заменяет transform у image_folder)
+    """
+    if transform is not None:
+        image_folder.transform = transform
+    sampler = PKBatchSampler(group_by_class(image_folder.samples), p=p, k=k, batches_per_epoch=batches_per_epoch,
+                             seed=seed)
+    return DataLoader(image_folder, batch_sampler=sampler, num_workers=num_workers,
+                      pin_memory=torch.cuda.is_available(), persistent_workers=num_workers > 0)
+
+
+def pairwise_distances(embeddings):
+    """Матрица евклидовых расстояний между всеми эмбеддингами пакета."""
+    dot = embeddings @ embeddings.T
+    squared = dot.diagonal()
+    distances = (squared.unsqueeze(0) - 2 * dot + squared.unsqueeze(1)).clamp(min=0)
+    # Корень от нуля даёт бесконечный градиент
+    return distances.clamp(min=1e-12).sqrt()
+
+
+def batch_hard_triplet_loss(embeddings, labels, margin=1.0, mining='hard'):
+    """
+    Triplet loss с выбором троек внутри пакета по матрице расстояний.
+    :param mining: 'hard' — для каждого якоря самый далёкий позитив и самый близкий негатив;
+                   'semi-hard' — для каждой пары якорь-позитив ближайший негатив дальше позитива
+                   (если такого нет — самый близкий негатив)
+    :return: (loss, точность в процентах: доля якорей, у которых самый далёкий позитив ближе самого близкого негатива)
+    """
+    distances = pairwise_distances(embeddings)
+    same = labels.unsqueeze(0) == labels.unsqueeze(1)
+    eye = torch.eye(len(labels), dtype=torch.bool, device=labels.device)
+    positive_mask = same & ~eye
+    negative_mask = ~same
+
+    inf = torch.tensor(float('inf'), device=distances.device)
+    hardest_positive = torch.where(positive_mask, distances, -inf).max(dim=1).values
+    hardest_negative = torch.where(negative_mask, distances, inf).min(dim=1).values
+    # Якоря без позитива или без негатива в пакете не участвуют
+    valid = positive_mask.any(dim=1) & negative_mask.any(dim=1)
+
+    if mining == 'hard':
+        losses = (hardest_positive - hardest_negative + margin).clamp(min=0)[valid]
+    elif mining == 'semi-hard':
+        # d_ap[a, p] и d_an[a, n] для всех пар сразу: B x B x B
+        d_ap = distances.unsqueeze(2)
+        d_an = distances.unsqueeze(1)
+        semi_hard = negative_mask.unsqueeze(1) & (d_an > d_ap) & (d_an < d_ap + margin)
+        chosen = torch.where(semi_hard, d_an, inf).min(dim=2).values
+        chosen = torch.where(torch.isinf(chosen), hardest_negative.unsqueeze(1), chosen)
+        pairs = positive_mask & valid.unsqueeze(1)
+        losses = (distances - chosen + margin).clamp(min=0)[pairs]
+    else:
+        raise ValueError(f"Неизвестный способ выбора троек: {mining}")
+
+    loss = losses.mean() if losses.numel() else distances.sum() * 0
+    with torch.no_grad():
+        accuracy = (hardest_positive < hardest_negative)[valid].float().mean().item() * 100 if valid.any() else 0.0
+    return loss, accuracy
+
+
+class BatchHardTripletLoss(nn.Module):
+    def __init__(self, margin=1.0, mining='hard'):
+        super().__init__()
+        self.margin = margin
+        self.mining = mining
+
+    def forward(self, embeddings, labels):
+        return batch_hard_triplet_loss(embeddings, labels, self.margin, self.mining)
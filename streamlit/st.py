@@ -1,73 +1,130 @@
+import os
+import sys
 import streamlit as st
-import cv2
-from ultralytics import YOLO
-import tempfile
+import time
 import numpy as np
 
-# Загрузка модели YOLO
-model = YOLO('best3.pt')
-
-def process_video(video_file):
-    # Использование временного файла для загрузки видео из streamlit
-    if hasattr(video_file, 'name'):
-        tfile = tempfile.NamedTemporaryFile(delete=False)
-        tfile.write(video_file.read())
-        cap = cv2.VideoCapture(tfile.name)
+# Общий конвейер детекции лежит в models/detection
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'detection'))
+from backends import SynchronizedBackend, UltralyticsBackend
+from model_registry import load_model, registry
+from video_pipeline import VideoPipeline
+from detection_cache import DetectionCache, video_hash
+from video_jobs import VideoJobManager, QUEUED, DONE, FAILED, CANCELLED
+
+WEIGHTS = 'best3.pt'
+CONF_THRESHOLD = 0.5
+# Модель одна на процесс, поэтому по умолчанию видео обрабатываются по очереди;
+# при большем числе потоков параллельно идут декодирование, отрисовка и запись видео
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 1))
+# Частота и ширина кадров предпросмотра, отправляемых в браузер
+PREVIEW_FPS = float(os.getenv('PREVIEW_FPS', 4))
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', 640))
+
+
+@st.cache_resource
+def get_pipeline():
+    # Один экземпляр модели на процесс: общий для всех сессий и перезапусков скрипта.
+    # При JOB_WORKERS > 1 конвейер используют несколько потоков, а модель ultralytics не потокобезопасна,
+    # поэтому инференс выполняется по одному пакету за раз
+    model = SynchronizedBackend(UltralyticsBackend(load_model(WEIGHTS)))
+    return VideoPipeline(model, batch_size=8, conf_threshold=CONF_THRESHOLD)
+
+
+@st.cache_resource
+def get_detection_cache():
+    return DetectionCache()
+
+
+def run_or_replay(path, pipeline, cache):
+    """Детекции из кэша, если это видео уже обрабатывалось этой моделью, иначе инференс с записью в кэш."""
+    key = cache.key(video_hash(path), registry.digest(WEIGHTS), CONF_THRESHOLD)
+
+    frames_detections = cache.load(key)
+    if frames_detections is not None:
+        return pipeline.replay(path, frames_detections)
+    return cache.record(key, pipeline.run(path))
+
+
+@st.cache_resource
+def get_job_manager():
+    # Конвейер и кэш берутся здесь, в потоке скрипта: фоновые потоки не обращаются к st.cache_resource
+    pipeline = get_pipeline()
+    cache = get_detection_cache()
+    return VideoJobManager(lambda path: run_or_replay(path, pipeline, cache), max_workers=JOB_WORKERS,
+                           preview_fps=PREVIEW_FPS, preview_width=PREVIEW_WIDTH)
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "—"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+def show_progress(job, manager, progress_bar, status, video_placeholder):
+    progress_bar.progress(job.progress)
+    if job.status == QUEUED:
+        status.text(f"В очереди, перед видео задач: {manager.queue_position(job)}")
     else:
-        cap = cv2.VideoCapture(video_file)
-
-    try:
-        if not cap.isOpened():
-            st.error("Ошибка: Не удалось открыть видео.")
-            return
-
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            # Детекция объектов с помощью YOLO
-            results = model(frame)  # Потоковая обработка
-
-            for r in results:
-                for box, conf, cls in zip(r.boxes.xyxy, r.boxes.conf, r.boxes.cls):
-                    x1, y1, x2, y2 = map(int, box[:4])  # Координаты ограничивающей рамки
-                    confidence = float(conf)  # Уверенность
-                    class_id = int(cls)  # Класс детекции
-
-                    if confidence > 0.5:  # Порог уверенности
-                        # Рисуем рамку вокруг объекта
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        label = f"Class: {class_id} Conf: {confidence:.2f}"
-                        # Выводим метку над рамкой
-                        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-            yield frame
-
-    finally:
-        cap.release()
-        if hasattr(video_file, 'name'):
-            tfile.close()
-            import os
-            os.remove(tfile.name)
+        status.text(f"Кадр {job.frames_done} из {job.frames_total or '?'} | {job.fps:.1f} кадр/с | "
+                    f"осталось {format_seconds(job.eta)}")
+    if job.preview is not None:
+        video_placeholder.image(job.preview, channels="BGR", use_container_width=True)
 
 
 def main():
     st.title("Детекция собак на видео")
 
     uploaded_file = st.file_uploader("Загрузите видеофайл", type=["mp4", "avi", "mov"])
-
-    if uploaded_file is not None:
-        st.subheader("Видео с детекцией")
-
-        # Создание placeholder для отображения кадров
-        video_placeholder = st.empty()
-
-        # Обработка видео и отображение кадров
-        for frame in process_video(uploaded_file):
-            # Отображаем кадр
-            video_placeholder.image(frame, channels="BGR", use_container_width=True)
+    if uploaded_file is None:
+        return
+
+    manager = get_job_manager()
+
+    # Загруженное видео ставится в очередь один раз, при перезапусках скрипта задача берётся из сессии
+    upload_id = getattr(uploaded_file, 'file_id', (uploaded_file.name, uploaded_file.size))
+    if st.session_state.get('upload_id') != upload_id:
+        job = manager.submit(uploaded_file, suffix=os.path.splitext(uploaded_file.name)[1])
+        st.session_state['job_id'] = job.id
+        st.session_state['upload_id'] = upload_id
+
+    job = manager.get(st.session_state['job_id'])
+    if job is None:
+        st.warning("Результаты обработки уже удалены, загрузите видео ещё раз.")
+        return
+
+    st.subheader("Видео с детекцией")
+    if not job.finished and st.button("Отменить обработку"):
+        job.cancel()
+
+    # Создание placeholder для отображения прогресса и кадров
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+    video_placeholder = st.empty()
+
+    # Обработка идёт в фоновом потоке, страница только опрашивает её состояние
+    while not job.finished:
+        show_progress(job, manager, progress_bar, status, video_placeholder)
+        time.sleep(1 / PREVIEW_FPS)
+    show_progress(job, manager, progress_bar, status, video_placeholder)
+
+    if job.status == DONE:
         st.success("Видео обработано!")
+        # Файлы задачи могли быть удалены при очистке старых задач
+        if os.path.exists(job.output_path):
+            with open(job.output_path, 'rb') as file:
+                st.download_button("Скачать видео с разметкой", file, file_name="annotated.mp4", mime="video/mp4")
+        else:
+            st.warning("Видео с разметкой недоступно.")
+        if os.path.exists(job.detections_path):
+            with open(job.detections_path, 'rb') as file:
+                st.download_button("Скачать детекции (csv)", file, file_name="detections.csv", mime="text/csv")
+    elif job.status == FAILED:
+        st.error(f"Ошибка при обработке видео: {job.error}")
+    elif job.status == CANCELLED:
+        st.warning("Обработка отменена.")
 
 
 if __name__ == "__main__":